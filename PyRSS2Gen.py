@@ -6,13 +6,18 @@ __author__ = "Andrew Dalke <dalke@dalkescientific.com>"
 
 _generator_name = __name__ + "-" + ".".join(map(str, __version__))
 
+ATOM_NAMESPACE = "http://www.w3.org/2005/Atom"
+
 import datetime
+import os
+import re
 
 import sys
 
 if sys.version_info[0] == 3:
     # Python 3
     basestring = str
+    unicode = str
     from io import StringIO
 else:
     # Python 2
@@ -26,7 +31,9 @@ else:
         from StringIO import StringIO
 
 # Could make this the base class; will need to add 'publish'
-class WriteXmlMixin:
+class WriteXmlMixin(object):
+    __slots__ = ()
+
     def write_xml(self, outfile, encoding = "iso-8859-1"):
         from xml.sax import saxutils
         handler = saxutils.XMLGenerator(outfile, encoding)
@@ -39,11 +46,137 @@ class WriteXmlMixin:
         self.write_xml(f, encoding)
         return f.getvalue()
 
+    def stream_xml(self, outfile, encoding = "iso-8859-1"):
+        """Write the document as encoded bytes to the binary file `outfile`
+
+        The output is the same as write_xml() to a binary file, but it
+        is produced by a StreamingXMLWriter, which is much faster and
+        only holds a small buffer in memory.
+        """
+        handler = StreamingXMLWriter(outfile, encoding)
+        handler.startDocument()
+        self.publish(handler)
+        handler.endDocument()
+
+
+# unicode.translate tables for the escaping done by xml.sax.saxutils.escape()
+# and quoteattr()
+_text_escapes = {ord("&"): u"&amp;", ord("<"): u"&lt;", ord(">"): u"&gt;"}
+_attr_escapes = dict(_text_escapes)
+_attr_escapes.update({ord("\n"): u"&#10;", ord("\r"): u"&#13;",
+                      ord("\t"): u"&#9;"})
+
+class StreamingXMLWriter(object):
+    """A fast stand-in for xml.sax.saxutils.XMLGenerator
+
+    Implements the part of the SAX handler API the 'publish' methods
+    use, writing encoded bytes to a binary file object.  Output is
+    byte-for-byte what XMLGenerator writes to a binary file: characters
+    the encoding can't represent become character references.
+
+    Escaping is done with translation tables, the encoded start and end
+    tags are cached, and output is collected in a buffer of about
+    `buffer_size` bytes before being handed to the file.
+    """
+    def __init__(self, outfile, encoding = "iso-8859-1", buffer_size = 65536):
+        import codecs
+        self._outfile = outfile
+        self._encoding = encoding
+        self._encode = codecs.getincrementalencoder(encoding)(
+            "xmlcharrefreplace").encode
+        self._buffer = bytearray()
+        self._buffer_size = buffer_size
+        self._tags = {}
+
+    def _text(self, content):
+        # byte strings (str on Python 2) are taken to be in the output
+        # encoding
+        if not isinstance(content, unicode):
+            content = content.decode(self._encoding)
+        return content
+
+    def _tag_bytes(self, name):
+        tags = self._tags[name] = (self._encode("<" + name + ">"),
+                                   self._encode("</" + name + ">"))
+        return tags
+
+    def _start_tag(self, name, attrs):
+        parts = ["<", name]
+        for attr_name, value in attrs.items():
+            value = self._text(value).translate(_attr_escapes)
+            if '"' in value:
+                if "'" in value:
+                    value = '"%s"' % value.replace('"', "&quot;")
+                else:
+                    value = "'%s'" % value
+            else:
+                value = '"%s"' % value
+            parts.append(" %s=%s" % (attr_name, value))
+        parts.append(">")
+        return self._encode("".join(parts))
+
+    def flush(self):
+        if self._buffer:
+            self._outfile.write(bytes(self._buffer))
+            del self._buffer[:]
+
+    def startDocument(self):
+        self._buffer += self._encode(
+            '<?xml version="1.0" encoding="%s"?>\n' % self._encoding)
+
+    def endDocument(self):
+        self.flush()
+        flush = getattr(self._outfile, "flush", None)
+        if flush is not None:
+            flush()
+
+    def startElement(self, name, attrs):
+        if attrs:
+            self._buffer += self._start_tag(name, attrs)
+        else:
+            self._buffer += (self._tags.get(name) or self._tag_bytes(name))[0]
+
+    def endElement(self, name):
+        buffer = self._buffer
+        buffer += (self._tags.get(name) or self._tag_bytes(name))[1]
+        if len(buffer) >= self._buffer_size:
+            self.flush()
+
+    def characters(self, content):
+        if content:
+            self._buffer += self._encode(
+                self._text(content).translate(_text_escapes))
+
+    def ignorableWhitespace(self, content):
+        if content:
+            self._buffer += self._encode(self._text(content))
+
+    def textElement(self, name, content, attrs):
+        """Write a whole element holding only text (or nothing)
+
+        Same as startElement(), characters(), endElement() in a row.
+        """
+        buffer = self._buffer
+        tags = self._tags.get(name) or self._tag_bytes(name)
+        if attrs:
+            buffer += self._start_tag(name, attrs)
+        else:
+            buffer += tags[0]
+        if content:
+            buffer += self._encode(
+                self._text(content).translate(_text_escapes))
+        buffer += tags[1]
+        if len(buffer) >= self._buffer_size:
+            self.flush()
+
 
 def _element(handler, name, obj, d = {}):
     if isinstance(obj, basestring) or obj is None:
         # special-case handling to make the API easier
         # to use for the common case.
+        if isinstance(handler, StreamingXMLWriter):
+            handler.textElement(name, obj, d)
+            return
         handler.startElement(name, d)
         if obj is not None:
             handler.characters(obj)
@@ -77,6 +210,40 @@ def _format_date(dt):
              "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"][dt.month-1],
             dt.year, dt.hour, dt.minute, dt.second)
 
+def _format_atom_date(dt):
+    """convert a datetime into an RFC 3339 date, as Atom uses
+
+    Input date must be in GMT.
+    """
+    return "%04d-%02d-%02dT%02d:%02d:%02dZ" % (
+            dt.year, dt.month, dt.day, dt.hour, dt.minute, dt.second)
+
+def _atom_date(handler, name, dt):
+    if isinstance(dt, DateElement):
+        dt = dt.dt
+    if isinstance(dt, datetime.datetime):
+        dt = _format_atom_date(dt)
+    _element(handler, name, dt)
+
+def _atom_person(handler, name, value):
+    """Publish an Atom person construct for an RSS email address
+
+    RSS has "joe@example.com (Joe Bloggs)"; Atom wants the name and
+    the email address apart.
+    """
+    email = None
+    m = re.match(r"\s*(\S+@\S+)\s+\((.+)\)\s*$", value)
+    if m is not None:
+        email, value = m.groups()
+    else:
+        m = re.match(r"\s*(.+?)\s*<(\S+@\S+)>\s*$", value)
+        if m is not None:
+            value, email = m.groups()
+    handler.startElement(name, {})
+    _element(handler, "name", value)
+    _opt_element(handler, "email", email)
+    handler.endElement(name)
+
         
 ##
 # A couple simple wrapper objects for the fields which
@@ -112,8 +279,9 @@ class DateElement:
         _element(handler, self.name, _format_date(self.dt))
 ####
 
-class Category:
+class Category(object):
     """Publish a category element"""
+    __slots__ = ("category", "domain")
     def __init__(self, category, domain = None):
         self.category = category
         self.domain = domain
@@ -122,6 +290,11 @@ class Category:
         if self.domain is not None:
             d["domain"] = self.domain
         _element(handler, "category", self.category, d)
+    def publish_atom(self, handler):
+        d = {"term": self.category}
+        if self.domain is not None:
+            d["scheme"] = self.domain
+        _element(handler, "category", None, d)
 
 class Cloud:
     """Publish a cloud"""
@@ -173,12 +346,13 @@ class Image:
 
         handler.endElement("image")
 
-class Guid:
+class Guid(object):
     """Publish a guid
 
     Defaults to being a permalink, which is the assumption if it's
     omitted.  Hence strings are always permalinks.
     """
+    __slots__ = ("guid", "isPermaLink")
     def __init__(self, guid, isPermaLink = 1):
         self.guid = guid
         self.isPermaLink = isPermaLink
@@ -189,6 +363,8 @@ class Guid:
         else:
             d["isPermaLink"] = "false"
         _element(handler, "guid", self.guid, d)
+    def publish_atom(self, handler):
+        _element(handler, "id", self.guid)
 
 class TextInput:
     """Publish a textInput
@@ -211,8 +387,9 @@ class TextInput:
         handler.endElement("textInput")
         
 
-class Enclosure:
+class Enclosure(object):
     """Publish an enclosure"""
+    __slots__ = ("url", "length", "type")
     def __init__(self, url, length, type):
         self.url = url
         self.length = length
@@ -223,14 +400,27 @@ class Enclosure:
                   "length": str(self.length),
                   "type": self.type,
                   })
+    def publish_atom(self, handler):
+        _element(handler, "link", None,
+                 {"rel": "enclosure",
+                  "href": self.url,
+                  "length": str(self.length),
+                  "type": self.type,
+                  })
 
-class Source:
+class Source(object):
     """Publish the item's original source, used by aggregators"""
+    __slots__ = ("name", "url")
     def __init__(self, name, url):
         self.name = name
         self.url = url
     def publish(self, handler):
         _element(handler, "source", self.name, {"url": self.url})
+    def publish_atom(self, handler):
+        handler.startElement("source", {})
+        _element(handler, "title", self.name)
+        _element(handler, "link", None, {"href": self.url})
+        handler.endElement("source")
 
 class SkipHours:
     """Publish the skipHours
@@ -267,9 +457,17 @@ class RSS2(WriteXmlMixin):
 
     Stores the channel attributes, with the "category" elements under
     ".categories" and the RSS items under ".items".
+
+    ".items" may be any iterable, including a generator; it is iterated
+    over once, when the feed is published, so the items of a large feed
+    can be created one at a time as they are written.
+
+    With a FragmentCache as ".fragment_cache" items whose XML is
+    already in the cache are not serialized again.
     """
     
     rss_attrs = {"version": "2.0"}
+    atom_attrs = {"xmlns": ATOM_NAMESPACE}
     element_attrs = {}
     def __init__(self,
                  title,
@@ -295,7 +493,10 @@ class RSS2(WriteXmlMixin):
                  skipHours = None, # a SkipHours with a list of integers
                  skipDays = None,  # a SkipDays with a list of strings
 
-                 items = None,     # list of RSSItems
+                 items = None,     # iterable of RSSItems
+
+                 fragment_cache = None, # a FragmentCache
+                 feed_url = None,  # where the Atom version is published
                  ):
         self.title = title
         self.link = link
@@ -324,8 +525,17 @@ class RSS2(WriteXmlMixin):
         if items is None:
             items = []
         self.items = items
+        self.fragment_cache = fragment_cache
+        self.feed_url = feed_url
 
     def publish(self, handler):
+        self._publish_channel(handler)
+        for item in self.items:
+            self._publish_item(item, handler)
+        handler.endElement("channel")
+        handler.endElement("rss")
+
+    def _publish_channel(self, handler):
         handler.startElement("rss", self.rss_attrs)
         handler.startElement("channel", self.element_attrs)
         _element(handler, "title", self.title)
@@ -376,21 +586,114 @@ class RSS2(WriteXmlMixin):
         if self.skipDays is not None:
             self.skipDays.publish(handler)
 
-        for item in self.items:
+    def _publish_item(self, item, handler, atom = False):
+        if self.fragment_cache is not None:
+            self.fragment_cache.publish(item, handler, atom)
+        elif atom:
+            item.publish_atom(handler)
+        else:
             item.publish(handler)
 
-        handler.endElement("channel")
-        handler.endElement("rss")
-
     def publish_extensions(self, handler):
         # Derived classes can hook into this to insert
         # output after the three required fields.
         pass
 
+    def publish_atom(self, handler):
+        """Publish the feed as an Atom 1.0 document
+
+        The channel fields map onto the Atom feed: ".feed_url" is
+        the feed's id and its rel="self" link (the link is the id
+        if there is no feed_url, but then feeds sharing a link
+        share their id too), the description becomes the subtitle,
+        lastBuildDate (or pubDate, or else the current time) the
+        updated date and copyright the rights.  Atom requires an
+        author for every entry, from the entry or the feed, so the
+        feed's author is managingEditor, or else webMaster, or else
+        the feed's title.  Fields Atom has no place for are left
+        out.
+        """
+        self._publish_atom_feed(handler)
+        for item in self.items:
+            self._publish_item(item, handler, atom = True)
+        handler.endElement("feed")
+
+    def _publish_atom_feed(self, handler):
+        handler.startElement("feed", self.atom_attrs)
+        _element(handler, "title", self.title)
+        _element(handler, "id", self.feed_url or self.link)
+        _element(handler, "link", None, {"href": self.link})
+        if self.feed_url is not None:
+            _element(handler, "link", None,
+                     {"rel": "self", "href": self.feed_url})
+        _opt_element(handler, "subtitle", self.description)
+
+        updated = self.lastBuildDate or self.pubDate
+        if updated is None:
+            updated = datetime.datetime.utcnow()
+        _atom_date(handler, "updated", updated)
+
+        author = self.managingEditor or self.webMaster
+        if author is not None:
+            _atom_person(handler, "author", author)
+        else:
+            handler.startElement("author", {})
+            _element(handler, "name", self.title)
+            handler.endElement("author")
+        for category in self.categories:
+            if isinstance(category, basestring):
+                category = Category(category)
+            category.publish_atom(handler)
+        _opt_element(handler, "generator", self.generator)
+        if self.image is not None:
+            _element(handler, "logo", self.image.url)
+        _opt_element(handler, "rights", self.copyright)
+
+    def write_atom(self, outfile, encoding = "iso-8859-1"):
+        """Like write_xml(), for the Atom version of the feed"""
+        from xml.sax import saxutils
+        handler = saxutils.XMLGenerator(outfile, encoding)
+        handler.startDocument()
+        self.publish_atom(handler)
+        handler.endDocument()
+
+    def stream_atom(self, outfile, encoding = "iso-8859-1"):
+        """Like stream_xml(), for the Atom version of the feed"""
+        handler = StreamingXMLWriter(outfile, encoding)
+        handler.startDocument()
+        self.publish_atom(handler)
+        handler.endDocument()
+
+    def stream_rss_and_atom(self, rss_file, atom_file,
+                            encoding = "iso-8859-1"):
+        """Write the RSS and the Atom version of the feed together
+
+        Both documents are written by StreamingXMLWriters, as with
+        stream_xml(), to the binary files 'rss_file' and 'atom_file'.
+        Each item is published to both as it is taken from ".items",
+        so the items are only iterated over once.
+        """
+        rss = StreamingXMLWriter(rss_file, encoding)
+        atom = StreamingXMLWriter(atom_file, encoding)
+        rss.startDocument()
+        atom.startDocument()
+        self._publish_channel(rss)
+        self._publish_atom_feed(atom)
+        for item in self.items:
+            self._publish_item(item, rss)
+            self._publish_item(item, atom, atom = True)
+        rss.endElement("channel")
+        rss.endElement("rss")
+        atom.endElement("feed")
+        rss.endDocument()
+        atom.endDocument()
+
     
     
 class RSSItem(WriteXmlMixin):
     """Publish an RSS Item"""
+    __slots__ = ("title", "link", "description", "author", "categories",
+                 "comments", "enclosure", "guid", "pubDate", "source")
     element_attrs = {}
     def __init__(self,
                  title = None,  # string
@@ -454,3 +757,188 @@ class RSSItem(WriteXmlMixin):
         # Derived classes can hook into this to insert
         # output after the title and link elements
         pass
+
+    def publish_atom(self, handler):
+        """Publish the item as an Atom entry
+
+        The guid becomes the entry's id (the link does if there is no
+        guid), pubDate both the published and the updated date, the
+        description the summary.  Comments and the enclosure become
+        links with rel "replies" and "enclosure".
+        """
+        handler.startElement("entry", self.element_attrs)
+        _opt_element(handler, "title", self.title)
+        if self.link is not None:
+            _element(handler, "link", None, {"href": self.link})
+        guid = self.guid
+        if isinstance(guid, Guid):
+            guid.publish_atom(handler)
+        else:
+            _opt_element(handler, "id", guid or self.link)
+        if self.pubDate is not None:
+            _atom_date(handler, "published", self.pubDate)
+            _atom_date(handler, "updated", self.pubDate)
+        if self.author is not None:
+            _atom_person(handler, "author", self.author)
+        for category in self.categories:
+            if isinstance(category, basestring):
+                category = Category(category)
+            category.publish_atom(handler)
+        _opt_element(handler, "summary", self.description)
+        if self.comments is not None:
+            _element(handler, "link", None,
+                     {"rel": "replies", "href": self.comments})
+        if self.enclosure is not None:
+            self.enclosure.publish_atom(handler)
+        if self.source is not None:
+            self.source.publish_atom(handler)
+        handler.endElement("entry")
+
+
+def _fingerprint(obj):
+    """Return a description of an item field which repr()s the same
+    for fields which publish the same XML
+
+    Returns None for values the cache doesn't know how to describe.
+    """
+    if obj is None or isinstance(obj, basestring):
+        return obj
+    if isinstance(obj, datetime.datetime):
+        return ("datetime", obj.isoformat())
+    if isinstance(obj, list):
+        fields = [_fingerprint(field) for field in obj]
+        if None in fields:
+            return None
+        return ("list",) + tuple(fields)
+    if type(obj) is Guid:
+        fields = (obj.guid, bool(obj.isPermaLink))
+    elif type(obj) is Category:
+        fields = (obj.category, obj.domain)
+    elif type(obj) is Enclosure:
+        fields = (obj.url, str(obj.length), obj.type)
+    elif type(obj) is Source:
+        fields = (obj.name, obj.url)
+    else:
+        return None
+    for field in fields:
+        if not isinstance(field, (basestring, bool, type(None))):
+            return None
+    return (type(obj).__name__,) + fields
+
+def _replace(src, dst):
+    """os.replace(), which Python 2 lacks"""
+    if hasattr(os, "replace"):
+        os.replace(src, dst)
+        return
+    if os.name == "nt" and os.path.exists(dst):
+        # rename() only replaces an existing file on POSIX
+        os.remove(dst)
+    os.rename(src, dst)
+
+
+class FragmentCache(object):
+    """Remembers the serialized XML of RSS items between runs
+
+    Pass one to RSS2 as 'fragment_cache' and each item is looked up by
+    a hash of its fields before it is published.  On a hit the stored
+    XML is written as is; on a miss the item is serialized once and
+    stored.  The fragments are kept as text and encoded when they are
+    written, so one cache serves every output encoding.
+
+    Only plain RSSItem instances whose fields are strings, datetimes,
+    Guid, Category, Enclosure or Source objects are cached; anything
+    else is published as usual.  At most 'max_entries' fragments are
+    kept, the least recently used are dropped first.
+
+    With a 'path' the cache is read from that file, if it exists, and
+    save() writes it back.
+    """
+    version = 2
+
+    def __init__(self, path = None, max_entries = 1000):
+        from collections import OrderedDict
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = self.misses = 0
+        self.changed = False
+        self._fragments = OrderedDict()
+        if path is not None:
+            self.load()
+
+    def __len__(self):
+        return len(self._fragments)
+
+    def load(self):
+        import json
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            return
+        if data.get("version") != self.version:
+            return
+        for key, fragment in data["fragments"][-self.max_entries:]:
+            self._fragments[key] = fragment
+
+    def save(self):
+        """Write the cache to 'path', if anything changed"""
+        import json
+        if self.path is None or not self.changed:
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"version": self.version,
+                       "fragments": list(self._fragments.items())},
+                      f, separators=(",", ":"))
+        _replace(tmp_path, self.path)
+        self.changed = False
+
+    def key(self, item, atom = False):
+        """Return the cache key of 'item', or None if it can't be cached"""
+        if type(item) is not RSSItem:
+            return None
+        fields = ["atom" if atom else "rss"]
+        for name in RSSItem.__slots__:
+            value = getattr(item, name)
+            fingerprint = _fingerprint(value)
+            if fingerprint is None and value is not None:
+                return None
+            fields.append(fingerprint)
+        import hashlib
+        return hashlib.sha1(repr(fields).encode("utf-8")).hexdigest()
+
+    def publish(self, item, handler, atom = False):
+        """Publish 'item' to 'handler', from the cache if possible
+
+        With 'atom' true the item is published as an Atom entry.
+        """
+        key = self.key(item, atom)
+        if key is None:
+            if atom:
+                item.publish_atom(handler)
+            else:
+                item.publish(handler)
+            return
+        fragments = self._fragments
+        fragment = fragments.get(key)
+        if fragment is None:
+            self.misses += 1
+            fragment = fragments[key] = self._render(item, atom)
+            if len(fragments) > self.max_entries:
+                fragments.popitem(last=False)
+            self.changed = True
+        else:
+            self.hits += 1
+            fragments[key] = fragments.pop(key)
+        handler.ignorableWhitespace(fragment)
+
+    def _render(self, item, atom):
+        from io import BytesIO
+        f = BytesIO()
+        writer = StreamingXMLWriter(f, "utf-8")
+        if atom:
+            item.publish_atom(writer)
+        else:
+            item.publish(writer)
+        writer.flush()
+        return f.getvalue().decode("utf-8")
@@ -0,0 +1,96 @@
+"""
+Peak memory of PyRSS2Gen while writing a feed of N items.
+
+"list" builds every RSSItem up front and serializes with write_xml(),
+"lazy" passes a generator of items to RSS2 and serializes with
+stream_xml().  Each case runs in a fresh interpreter and reports its peak
+resident set size (ru_maxrss) and the peak of the memory allocated by
+Python while writing (tracemalloc).
+
+Python 3.11, Linux:
+
+   items  list: RSS MB  traced MB   lazy: RSS MB  traced MB
+    1000          25.1        3.6          13.4        0.1
+   10000          34.9        7.5          13.4        0.1
+  100000         137.7       46.1          13.4        0.1
+
+Without __slots__ on the element classes the 100000 item list case
+peaked at 163.8 MB RSS, 54.5 MB traced.
+
+=> the lazy feed stays flat with the number of items
+"""
+import datetime
+import resource
+import subprocess
+import sys
+import tracemalloc
+
+import PyRSS2Gen as rssgen
+
+SIZES = (1000, 10000, 100000)
+MODES = ("list", "lazy")
+
+
+class NullFile:
+    """Binary or text sink that only counts what is written"""
+    def __init__(self):
+        self.size = 0
+    def write(self, data):
+        self.size += len(data)
+
+
+def make_items(count):
+    start = datetime.datetime(2000, 1, 1)
+    for i in range(count):
+        url = "http://www.python.org/dev/peps/pep-%0.4d/%d" % (i % 10000, i)
+        yield rssgen.RSSItem(
+            title = "PEP %d: Item number %d" % (i % 10000, i),
+            link = url,
+            description = "Author: Some One <someone@example.com>",
+            categories = ["Standards Track", "Draft"],
+            guid = rssgen.Guid(url),
+            pubDate = start + datetime.timedelta(minutes=i))
+
+
+def run(mode, count):
+    tracemalloc.start()
+    if mode == "list":
+        items = list(make_items(count))
+    else:
+        items = make_items(count)
+    rss = rssgen.RSS2(
+        title = "Benchmark feed",
+        link = "http://www.python.org/dev/peps",
+        description = "%d items" % count,
+        lastBuildDate = datetime.datetime(2000, 1, 1),
+        items = items)
+    if mode == "list":
+        rss.write_xml(NullFile(), encoding="utf-8")
+    else:
+        rss.stream_xml(NullFile(), encoding="utf-8")
+    traced = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        maxrss //= 1024
+    print(maxrss * 1024, traced)
+
+
+def main():
+    print("   items  list: RSS MB  traced MB   lazy: RSS MB  traced MB")
+    for count in SIZES:
+        row = []
+        for mode in MODES:
+            out = subprocess.check_output(
+                [sys.executable, __file__, mode, str(count)])
+            maxrss, traced = map(int, out.split())
+            row.extend((maxrss / 2.0**20, traced / 2.0**20))
+        print("%8d  %12.1f  %9.1f  %12.1f  %9.1f" % ((count,) + tuple(row)))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3:
+        run(sys.argv[1], int(sys.argv[2]))
+    else:
+        main()
@@ -13,6 +13,13 @@ With the PEP information collected, to create the index itself you must:
     2. Format an entry for the PEP.
     3. Output the PEP (both by category and numerical index).
 
+While parsing, the cross-reference graph of the PEPs is brought up to date
+in pep-graph.json (see pep0.graph).
+
+Run with ``--check [path ...]`` to only validate the PEPs (see pep0.check),
+or with ``--graph`` to report cycles and references to missing PEPs found
+in the graph; the exit status is non-zero if any problem was found.
+
 """
 from __future__ import absolute_import, with_statement
 from __future__ import print_function
@@ -23,11 +30,16 @@ import codecs
 
 from operator import attrgetter
 
+from pep0 import check, graph
 from pep0.output import write_pep0
-from pep0.pep import PEP, PEPError
+from pep0.pep import PEP, PEPError, find_pep_files
 
 
 def main(argv):
+    if argv[1:2] == ['--check']:
+        return check.main(argv[2:])
+    if argv[1:2] == ['--graph']:
+        return graph.main(argv[2:])
     if not argv[1:]:
         path = '.'
     else:
@@ -35,26 +47,28 @@ def main(argv):
 
     peps = []
     if os.path.isdir(path):
-        for file_path in os.listdir(path):
-            if file_path.startswith('pep-0000.'):
-                continue
-            abs_file_path = os.path.join(path, file_path)
-            if not os.path.isfile(abs_file_path):
-                continue
-            if file_path.startswith("pep-") and file_path.endswith((".txt", "rst")):
-                with codecs.open(abs_file_path, 'r', encoding='UTF-8') as pep_file:
-                    try:
-                        pep = PEP(pep_file)
-                        if pep.number != int(file_path[4:-4]):
-                            raise PEPError('PEP number does not match file name',
-                                           file_path, pep.number)
-                        peps.append(pep)
-                    except PEPError as e:
-                        errmsg = "Error processing PEP %s (%s), excluding:" % \
-                            (e.number, e.filename)
-                        print(errmsg, e, file=sys.stderr)
-                        sys.exit(1)
+        pep_graph = graph.PEPGraph.load(graph.GRAPH_NAME)
+        for abs_file_path in find_pep_files(path):
+            file_path = os.path.basename(abs_file_path)
+            with codecs.open(abs_file_path, 'r', encoding='UTF-8') as pep_file:
+                try:
+                    pep = PEP(pep_file)
+                    if pep.number != int(file_path[4:-4]):
+                        raise PEPError('PEP number does not match file name',
+                                       file_path, pep.number)
+                    peps.append(pep)
+                    pep_file.seek(0)
+                    pep_graph.update(pep.number, abs_file_path,
+                                     pep_file.read())
+                except PEPError as e:
+                    errmsg = "Error processing PEP %s (%s), excluding:" % \
+                        (e.number, e.filename)
+                    print(errmsg, e, file=sys.stderr)
+                    sys.exit(1)
         peps.sort(key=attrgetter('number'))
+        pep_graph.finish()
+        if pep_graph.changed:
+            pep_graph.save(graph.GRAPH_NAME)
     elif os.path.isfile(path):
         with open(path, 'r') as pep_file:
             peps.append(PEP(pep_file))
@@ -65,4 +79,4 @@ def main(argv):
         write_pep0(peps, pep0_file)
 
 if __name__ == "__main__":
-    main(sys.argv)
+    sys.exit(main(sys.argv))
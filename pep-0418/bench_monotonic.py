@@ -0,0 +1,67 @@
+"""
+Cost of a reading of the synthetic monotonic clocks of clockutils, in
+nanoseconds per call, from one thread and shared by several threads.
+The base clock is time.time(), read alone for reference.
+
+Python 3.11, Linux, 1 CPU (timings on this machine vary by up to 50%
+between runs):
+
+clock                         1 thread 4 threads
+time.time() clock               120 ns    152 ns
+SyntheticMonotonic              258 ns    254 ns
+ThreadSafeSyntheticMonotonic    392 ns    611 ns
+
+=> the reading is about twice as expensive as with SyntheticMonotonic:
+   time.time() moves on at almost every reading, so most readings take
+   the lock
+"""
+import threading
+import time
+
+import clockutils
+
+CALLS = 200000
+REPEAT = 5
+THREAD_COUNTS = (1, 4)
+
+
+def bench(now, threads):
+    """Return the best time per call of `threads` threads calling now()"""
+    def reader():
+        start.wait()
+        for _ in range(CALLS):
+            now()
+
+    best = None
+    for _ in range(REPEAT):
+        start = threading.Barrier(threads + 1)
+        workers = [threading.Thread(target=reader) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        start.wait()
+        t0 = time.perf_counter()
+        for worker in workers:
+            worker.join()
+        dt = (time.perf_counter() - t0) / (CALLS * threads)
+        best = dt if best is None else min(best, dt)
+    return best
+
+
+def main():
+    clocks = [
+        ("time.time() clock", clockutils._TimeDotTimeClock()),
+        ("SyntheticMonotonic", clockutils.SyntheticMonotonic()),
+        ("ThreadSafeSyntheticMonotonic",
+         clockutils.ThreadSafeSyntheticMonotonic()),
+    ]
+    print("%-28s" % "clock" +
+          "".join("%10s" % ("%d thread%s" % (n, "s" if n > 1 else ""))
+                  for n in THREAD_COUNTS))
+    for name, clock in clocks:
+        print("%-28s" % name +
+              "".join("%7.0f ns" % (bench(clock.now, n) * 1e9)
+                      for n in THREAD_COUNTS))
+
+
+if __name__ == "__main__":
+    main()
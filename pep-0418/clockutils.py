@@ -13,8 +13,9 @@
 #
 
 from collections import namedtuple
-from time import time
+from time import time, perf_counter
 import os
+import threading
 
 # the module exposing OS clock features
 _time = os
@@ -49,20 +50,17 @@ def get_clocks(flags=0, clocklist=None):
 def monotonic_clock(other_flags=0):
     ''' Return a monotonic clock, preferably high resolution.
     '''
-    return get_clock(MONOTONIC|HIGHRES|other_flags, MONOTONIC_CLOCKS) \
-        or get_clock(MONOTONIC|other_flags, MONOTONIC_CLOCKS)
+    return REGISTRY.clock(MONOTONIC|other_flags, prefer=HIGHRES)
 
 def steady_clock(other_flags=0):
     ''' Return a steady clock, preferably high resolution.
     '''
-    return get_clock(STEADY|HIGHRES|other_flags, STEADY_CLOCKS) \
-        or get_clock(STEADY|other_flags, STEADY_CLOCKS)
+    return REGISTRY.clock(STEADY|other_flags, prefer=HIGHRES)
 
 def highres_clock(other_flags=0):
     ''' Return a high resolution clock, preferably steady.
     '''
-    return get_clock(HIGHRES|STEADY|other_flags, HIGHRES_CLOCKS) \
-        or get_clock(HIGHRES|other_flags, HIGHRES_CLOCKS)
+    return REGISTRY.clock(HIGHRES|other_flags, prefer=STEADY)
 
 _global_monotonic = None
 
@@ -71,10 +69,8 @@ def monotonic():
     '''
     global _global_monotonic
     if _global_monotonic is None:
-        _global_monotonic = monotonic_clock()
-        if _global_monotonic is None:
-            raise RunTimeError("no monotonic clock available")
-    return _global_monotonic.now()
+        _global_monotonic = REGISTRY.now(MONOTONIC, prefer=HIGHRES)
+    return _global_monotonic()
 
 _global_hires = None
 
@@ -83,10 +79,8 @@ def highres():
     '''
     global _global_hires
     if _global_hires is None:
-        _global_hires = highres()
-        if _global_hires is None:
-            raise RunTimeError("no highres clock available")
-    return _global_hires.now()
+        _global_hires = REGISTRY.now(HIGHRES, prefer=STEADY)
+    return _global_hires()
 
 _global_steady = None
 
@@ -95,10 +89,113 @@ def steady():
     '''
     global _global_steady
     if _global_steady is None:
-        _global_steady = steady()
-        if _global_steady is None:
-            raise RunTimeError("no steady clock available")
-    return _global_steady.now()
+        _global_steady = REGISTRY.now(STEADY, prefer=HIGHRES)
+    return _global_steady()
+
+ClockInfo = namedtuple('ClockInfo', 'clock now resolution overhead')
+
+def measure_clock(now, max_time=0.01, points=20, calls=1000):
+    ''' Measure the clock reading function `now`.
+        Return (resolution, overhead): the smallest step seen between
+        two readings and the mean cost of a call, both in seconds.
+        The resolution is None if the clock never moved within
+        `max_time` seconds.
+    '''
+    resolution = None
+    seen = 0
+    deadline = time() + max_time
+    previous = now()
+    while seen < points and time() < deadline:
+        t = now()
+        dt = t - previous
+        if dt > 0:
+            if resolution is None or dt < resolution:
+                resolution = dt
+            seen += 1
+        previous = t
+    start = perf_counter()
+    for _ in range(calls):
+        now()
+    overhead = (perf_counter() - start) / calls
+    return resolution, overhead
+
+class ClockRegistry(object):
+    ''' Pick clocks by flags once and remember the choice.
+        Each entry of `clocklist` (default ALL_CLOCKS) is instantiated
+        and measured with measure_clock() the first time it is a
+        candidate. For a given (flags, prefer) the best clock is the
+        one with all of `flags` and the most of `prefer`, then with the
+        finest measured resolution, then the cheapest call, then
+        the earliest in `clocklist`.
+    '''
+
+    def __init__(self, clocklist=None):
+        if clocklist is None:
+            clocklist = ALL_CLOCKS
+        self.clocklist = clocklist
+        self._infos = {}
+        self._best = {}
+
+    def info(self, entry):
+        ''' Return the ClockInfo of the ClockEntry `entry`, measuring it
+            on first use.
+        '''
+        try:
+            return self._infos[entry]
+        except KeyError:
+            clock = entry.factory()
+            now = clock.now
+            resolution, overhead = measure_clock(now)
+            info = self._infos[entry] = ClockInfo(clock, now, resolution,
+                                                  overhead)
+            return info
+
+    def best(self, flags=0, prefer=0):
+        ''' Return the ClockInfo of the best clock with `flags`,
+            preferring those also having the flags in `prefer`.
+            Return None if no clock has `flags`.
+        '''
+        key = (flags, prefer)
+        try:
+            return self._best[key]
+        except KeyError:
+            pass
+        candidates = []
+        for order, entry in enumerate(self.clocklist):
+            if entry.flags & flags == flags:
+                info = self.info(entry)
+                missing = bin(prefer & ~entry.flags).count('1')
+                resolution = info.resolution
+                if resolution is None:
+                    resolution = float('inf')
+                candidates.append((missing, resolution, info.overhead, order,
+                                   info))
+        best = min(candidates)[-1] if candidates else None
+        self._best[key] = best
+        return best
+
+    def clock(self, flags=0, prefer=0):
+        ''' Return the best clock with `flags`, or None.
+        '''
+        info = self.best(flags, prefer)
+        return None if info is None else info.clock
+
+    def now(self, flags=0, prefer=0):
+        ''' Return the bound now() method of the best clock with `flags`.
+            Raise RuntimeError if no clock has `flags`.
+        '''
+        info = self.best(flags, prefer)
+        if info is None:
+            raise RuntimeError("no clock with flags %s available"
+                               % (_Clock_Flags(flags),))
+        return info.now
+
+    def clear(self):
+        ''' Forget all choices and measurements, for example after
+            changing `clocklist`.
+        '''
+        self._infos.clear()
+        self._best.clear()
 
 class _Clock_Flags(int):
     ''' An int with human friendly str() and repr() for clock flags.
@@ -392,7 +489,40 @@ class SyntheticMonotonic(_Clock):
             t = last
         return t
 
-ALL_CLOCKS.append( ClockEntry(SyntheticMonotonic.flags, SyntheticMonotonic) )
+# SyntheticMonotonic.now() reads, compares and writes its high-water mark
+# without synchronisation: a thread can store an older reading over a newer
+# one stored meanwhile by another thread, and time goes backwards.
+# This variant only takes a lock when the base clock has moved past the
+# high-water mark, so that the mark only ever increases; readings at or
+# below it return it without locking.
+class ThreadSafeSyntheticMonotonic(SyntheticMonotonic):
+    ''' A SyntheticMonotonic clock which may be shared between threads.
+        No reading is ever earlier than one returned before, in any thread.
+    '''
+    def __init__(self, base_clock=None):
+        SyntheticMonotonic.__init__(self, base_clock)
+        self._base_now = self.base_clock.now
+        self._high = float('-inf')
+        self._lock = threading.Lock()
+    def now(self):
+        t = self._base_now()
+        high = self._high
+        if t <= high:
+            return high
+        lock = self._lock
+        lock.acquire()
+        try:
+            high = self._high
+            if t > high:
+                self._high = high = t
+        finally:
+            lock.release()
+        return high
+
+# monotonic() and friends hand out one shared instance, so register the
+# thread safe variant
+ALL_CLOCKS.append( ClockEntry(ThreadSafeSyntheticMonotonic.flags,
+                              ThreadSafeSyntheticMonotonic) )
 
 # With more clocks, these will be ALL_CLOCKS listed in order of preference
 # for these types i.e. MONOTONIC_CLOCKS will list only monotonic clocks
@@ -401,8 +531,16 @@ MONOTONIC_CLOCKS = ALL_CLOCKS
 HIGHRES_CLOCKS = ALL_CLOCKS
 STEADY_CLOCKS = ALL_CLOCKS
 
+# the registry behind monotonic(), highres(), steady() and *_clock()
+REGISTRY = ClockRegistry(ALL_CLOCKS)
+
 if __name__ == '__main__':
     print("ALL_CLOCKS =", repr(ALL_CLOCKS))
     for clock in get_clocks():
         print("clock = %r" % (clock,))
         print(clock.__class__.__doc__)
+    for entry in ALL_CLOCKS:
+        info = REGISTRY.info(entry)
+        print("%s: resolution %s s, %.0f ns/call"
+              % (info.clock.__class__.__name__, info.resolution,
+                 info.overhead * 1e9))
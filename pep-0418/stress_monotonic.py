@@ -0,0 +1,78 @@
+"""
+Stress test of the synthetic monotonic clocks of clockutils from many threads.
+
+Every thread reads a shared clock and checks that no reading is earlier
+than the latest reading any thread had completed before it started its
+own.  The base clock jitters backwards by up to a millisecond so that
+the synthetic clock really has to hide steps back, and the interpreter
+switches threads as often as it can.
+
+Exits with status 1 if ThreadSafeSyntheticMonotonic went backwards.  The
+unsynchronised SyntheticMonotonic is run too, for comparison; it usually
+does.
+"""
+import random
+import sys
+import threading
+import time
+
+import clockutils
+
+THREADS = 8
+READS = 20000
+JITTER = 0.001
+
+
+class JitteryClock(object):
+    """perf_counter() minus a random delay of up to JITTER seconds"""
+    def __init__(self):
+        self.random = random.Random(0)
+    def now(self):
+        return time.perf_counter() - self.random.random() * JITTER
+
+
+def stress(clock_class):
+    clock = clock_class(JitteryClock())
+    # latest[i] is the last reading completed by thread i
+    latest = [float('-inf')] * THREADS
+    errors = []
+    start = threading.Barrier(THREADS)
+
+    def reader(index):
+        start.wait()
+        for _ in range(READS):
+            before = max(latest)
+            t = clock.now()
+            if t < before:
+                errors.append(before - t)
+            latest[index] = t
+
+    threads = [threading.Thread(target=reader, args=(index,))
+               for index in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors
+
+
+def main():
+    sys.setswitchinterval(1e-6)
+    failed = False
+    for clock_class in (clockutils.SyntheticMonotonic,
+                        clockutils.ThreadSafeSyntheticMonotonic):
+        errors = stress(clock_class)
+        if errors:
+            print("%s: %d of %d readings went back, by up to %.0f us"
+                  % (clock_class.__name__, len(errors), THREADS * READS,
+                     max(errors) * 1e6))
+        else:
+            print("%s: %d readings, never went back"
+                  % (clock_class.__name__, THREADS * READS))
+        if errors and clock_class is clockutils.ThreadSafeSyntheticMonotonic:
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,12 +5,24 @@
 #
 # Requires distlib, original script written by Vinay Sajip
 
+import argparse
+import collections
+import http.client
+import itertools
 import logging
+import operator
+import os
+import random
 import re
+import sqlite3
 import sys
 import json
 import errno
 import time
+from collections.abc import ItemsView, Mapping
+from concurrent.futures import (ProcessPoolExecutor, ThreadPoolExecutor,
+                                as_completed)
+from urllib.request import pathname2url
 
 from distlib.compat import xmlrpclib
 from distlib.version import suggest_normalized_version, legacy_key, normalized_key
@@ -65,33 +77,294 @@ def pep426_key(s):
 def is_release_version(s):
     return not bool(PEP426_PRERELEASE_RE.search(s))
 
-def cache_projects(cache_name):
-    logger.info("Retrieving package data from PyPI")
-    client = xmlrpclib.ServerProxy('http://python.org/pypi')
-    projects = dict.fromkeys(client.list_packages())
-    public = projects.copy()
-    failed = []
-    for pname in projects:
-        time.sleep(0.01)
-        logger.debug("Retrieving versions for %s", pname)
+PYPI_URL = 'http://python.org/pypi'
+
+# Errors after which a request to the index is worth retrying
+TRANSIENT_ERRORS = (OSError, http.client.HTTPException, xmlrpclib.ProtocolError)
+
+def _retry(call, retries, backoff):
+    """Return call(), retrying after transient errors.
+
+    The delay before retry n is `backoff` * 2**n seconds, with some jitter.
+    """
+    for attempt in itertools.count():
+        try:
+            return call()
+        except TRANSIENT_ERRORS as exc:
+            if attempt >= retries:
+                raise
+            delay = backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+            logger.debug("Retrying in %.2fs after %s", delay, exc)
+            time.sleep(delay)
+
+def _fetch_batch(url, names, retries, backoff):
+    """Return {name: (all versions, public versions)} for `names`.
+
+    Both package_releases() calls for every name are sent in one request
+    with MultiCall, unless the server doesn't support it.  A name whose
+    calls failed maps to None.
+    """
+    # ServerProxy objects are not thread safe, each batch gets its own
+    client = xmlrpclib.ServerProxy(url)
+
+    def multicall():
+        multicall = xmlrpclib.MultiCall(client)
+        for pname in names:
+            multicall.package_releases(pname, True)
+            multicall.package_releases(pname)
+        return multicall()
+
+    try:
+        results = _retry(multicall, retries, backoff)
+    except xmlrpclib.Fault:
+        logger.debug("No MultiCall support, retrieving versions one by one")
+        results = []
+        for pname in names:
+            for args in ((pname, True), (pname,)):
+                # keep the fault, like MultiCall does, so that it only
+                # fails this project
+                try:
+                    results.append(_retry(
+                        lambda: client.package_releases(*args),
+                        retries, backoff))
+                except xmlrpclib.Fault as exc:
+                    results.append(exc)
+    found = {}
+    for i, pname in enumerate(names):
         try:
-            projects[pname] = list(client.package_releases(pname, True))
-            public[pname] = list(client.package_releases(pname))
-        except:
-            failed.append(pname)
-    logger.warn("Error retrieving versions for %s", failed)
-    with open(cache_name, 'w') as f:
-        json.dump([projects, public], f, sort_keys=True,
-                  indent=2, separators=(',', ': '))
+            versions = (results[2 * i], results[2 * i + 1])
+            for result in versions:
+                if isinstance(result, xmlrpclib.Fault):
+                    raise result
+            found[pname] = (list(versions[0]), list(versions[1]))
+        except xmlrpclib.Fault as exc:
+            logger.debug("Retrieving versions for %s failed: %s", pname, exc)
+            found[pname] = None
+    return found
+
+def _save_json(path, data, **kwargs):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, **kwargs)
+    os.replace(tmp_path, path)
+
+def _load_checkpoint(checkpoint_name, url):
+    # The first line holds the state when retrieval (re)started, the others
+    # the versions of one batch each
+    try:
+        with open(checkpoint_name) as f:
+            state = json.loads(f.readline())
+            if state.get('url') != url:
+                return None
+            for line in f:
+                try:
+                    batch = json.loads(line)
+                except ValueError:
+                    # cut short by a crash
+                    continue
+                state['projects'].update(batch['projects'])
+                state['public'].update(batch['public'])
+    except (OSError, ValueError):
+        return None
+    return state
+
+def _start_checkpoint(checkpoint_name, state):
+    """Write `state` to a new checkpoint file and return the file, open to
+    append the batches retrieved next."""
+    tmp_path = checkpoint_name + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+        f.write('\n')
+    os.replace(tmp_path, checkpoint_name)
+    return open(checkpoint_name, 'a')
+
+def fetch_projects(cache_name, url=PYPI_URL, workers=8, batch_size=50,
+                   retries=4, backoff=0.5, checkpoint_every=20):
+    """Retrieve the versions of every project on the index at `url`.
+
+    Batches of `batch_size` projects are retrieved by `workers` threads.
+    Each batch is appended to the checkpoint `cache_name` + '.partial' as
+    it comes in, the file being flushed every `checkpoint_every` batches
+    and when interrupted, and a later call resumes from there.  Projects
+    that could not be retrieved get None instead of their versions; the
+    checkpoint is then kept, so that removing `cache_name` and fetching
+    again only retries those.
+
+    Return the dicts of all and of public versions by project name and
+    write them to `cache_name`.
+    """
+    checkpoint_name = cache_name + '.partial'
+    state = _load_checkpoint(checkpoint_name, url)
+    if state is None:
+        logger.info("Retrieving package data from %s", url)
+        client = xmlrpclib.ServerProxy(url)
+        names = _retry(client.list_packages, retries, backoff)
+        state = {'url': url, 'names': names, 'projects': {}, 'public': {}}
+    else:
+        logger.info("Resuming retrieval of package data from %s", url)
+    done_projects, done_public = state['projects'], state['public']
+    todo = [pname for pname in state['names'] if pname not in done_projects]
+    logger.info("Retrieving versions for %d of %d projects",
+                len(todo), len(state['names']))
+
+    failed = []
+    # rewritten once per call, so that it doesn't grow across resumptions
+    checkpoint = _start_checkpoint(checkpoint_name, state)
+    executor = ThreadPoolExecutor(workers)
+    try:
+        batches = {}
+        for start in range(0, len(todo), batch_size):
+            batch = todo[start:start + batch_size]
+            future = executor.submit(_fetch_batch, url, batch, retries, backoff)
+            batches[future] = batch
+        for done, future in enumerate(as_completed(batches), 1):
+            try:
+                found = future.result()
+            except (xmlrpclib.Error,) + TRANSIENT_ERRORS as exc:
+                logger.warning("Error retrieving versions for %d projects: %s",
+                               len(batches[future]), exc)
+                failed.extend(batches[future])
+                continue
+            batch_projects, batch_public = {}, {}
+            for pname, versions in found.items():
+                if versions is None:
+                    failed.append(pname)
+                else:
+                    batch_projects[pname], batch_public[pname] = versions
+            done_projects.update(batch_projects)
+            done_public.update(batch_public)
+            if batch_projects:
+                checkpoint.write(json.dumps({'projects': batch_projects,
+                                             'public': batch_public}) + '\n')
+            if done % checkpoint_every == 0:
+                checkpoint.flush()
+    except BaseException:
+        executor.shutdown(cancel_futures=True)
+        checkpoint.close()
+        raise
+    executor.shutdown()
+    checkpoint.close()
+
+    projects = dict.fromkeys(state['names'])
+    public = projects.copy()
+    projects.update(done_projects)
+    public.update(done_public)
+    _save_json(cache_name, [projects, public], sort_keys=True,
+               indent=2, separators=(',', ': '))
+    if failed:
+        logger.warning("Error retrieving versions for %s", sorted(failed))
+    else:
+        os.remove(checkpoint_name)
     return projects, public
 
-def get_projects(cache_name):
+def cache_projects(cache_name, url=PYPI_URL):
+    return fetch_projects(cache_name, url)
+
+class SQLiteProjects(Mapping):
+    """Read-only mapping of project names to versions stored in SQLite.
+
+    Nothing is loaded up front: lookups query the database and iterating
+    over items() streams the rows in catalogue order.  `column` is
+    'versions' for all versions or 'public' for the public ones.
+    """
+
+    def __init__(self, connection, column):
+        if column not in ('versions', 'public'):
+            raise ValueError('Unknown column: %s' % column)
+        self._connection = connection
+        self._column = column
+
+    def __len__(self):
+        return self._connection.execute(
+            'SELECT COUNT(*) FROM projects').fetchone()[0]
+
+    def __getitem__(self, pname):
+        row = self._connection.execute(
+            'SELECT %s FROM projects WHERE name = ?' % self._column,
+            (pname,)).fetchone()
+        if row is None:
+            raise KeyError(pname)
+        return _load_versions(row[0])
+
+    def __iter__(self):
+        for pname, in self._connection.execute(
+                'SELECT name FROM projects ORDER BY id'):
+            yield pname
+
+    def __contains__(self, pname):
+        return self._connection.execute(
+            'SELECT 1 FROM projects WHERE name = ?', (pname,)).fetchone() \
+            is not None
+
+    def items(self):
+        return _SQLiteItems(self)
+
+    def _iter_items(self):
+        for pname, versions in self._connection.execute(
+                'SELECT name, %s FROM projects ORDER BY id' % self._column):
+            yield pname, _load_versions(versions)
+
+class _SQLiteItems(ItemsView):
+
+    def __iter__(self):
+        return self._mapping._iter_items()
+
+def _load_versions(text):
+    return None if text is None else json.loads(text)
+
+def convert_json_cache(json_name, sqlite_name):
+    """Write the projects of the JSON cache `json_name` to `sqlite_name`."""
+    with open(json_name) as f:
+        projects, public = json.load(f)
+    tmp_name = sqlite_name + '.tmp'
+    if os.path.exists(tmp_name):
+        os.remove(tmp_name)
+    connection = sqlite3.connect(tmp_name)
+    try:
+        with connection:
+            connection.execute(
+                'CREATE TABLE projects (id INTEGER PRIMARY KEY, '
+                'name TEXT UNIQUE NOT NULL, versions TEXT, public TEXT)')
+            connection.executemany(
+                'INSERT INTO projects (name, versions, public) '
+                'VALUES (?, ?, ?)',
+                ((pname, _dump_versions(versions),
+                  _dump_versions(public.get(pname)))
+                 for pname, versions in sorted(projects.items())))
+    finally:
+        connection.close()
+    os.replace(tmp_name, sqlite_name)
+
+def _dump_versions(versions):
+    return None if versions is None else json.dumps(versions)
+
+def open_sqlite_cache(sqlite_name):
+    """Return the all and public versions mappings of an SQLite cache."""
+    connection = sqlite3.connect('file:%s?mode=ro' % pathname2url(
+        os.path.abspath(sqlite_name)), uri=True)
+    return (SQLiteProjects(connection, 'versions'),
+            SQLiteProjects(connection, 'public'))
+
+def get_projects(cache_name, url=PYPI_URL):
+    """Return the all and public versions of every project by name.
+
+    With a `cache_name` ending in .sqlite, the SQLite cache is used; if
+    it doesn't exist yet it is converted from the JSON cache of the same
+    name, which is itself retrieved from `url` if needed.
+    """
+    if cache_name.endswith(SQLITE_SUFFIX):
+        if not os.path.exists(cache_name):
+            json_name = cache_name[:-len(SQLITE_SUFFIX)] + '.json'
+            get_projects(json_name, url)
+            logger.info("Converting %s to %s", json_name, cache_name)
+            convert_json_cache(json_name, cache_name)
+        return open_sqlite_cache(cache_name)
     try:
         f = open(cache_name)
     except IOError as exc:
         if exc.errno != errno.ENOENT:
             raise
-        projects, public = cache_projects(cache_name);
+        projects, public = cache_projects(cache_name, url);
     else:
         with f:
             projects, public = json.load(f)
@@ -99,6 +372,7 @@ def get_projects(cache_name):
 
 
 VERSION_CACHE = "pepsort_cache.json"
+SQLITE_SUFFIX = ".sqlite"
 
 class Category(set):
 
@@ -119,122 +393,264 @@ SORT_KEYS = {
     "426": pep426_key,
 }
 
+class VersionKeys:
+    """Keys of version strings, computed once and shared by the analyses.
+
+    For each distinct version string, get() returns a (key, translation,
+    is release) tuple: key is its `sort_key` key, or that of the version
+    suggested for it if it has none, and None if neither exists;
+    translation is the suggested version, None if there was no suggestion
+    or the version itself if none was needed.
+    """
+
+    def __init__(self, sort_key):
+        self.sort_key = sort_key
+        self._keys = {}
+        self._legacy_keys = {}
+
+    def update(self, projects):
+        """Compute the keys of all versions in `projects` not seen yet."""
+        new = set()
+        for pname, versions in projects.items():
+            if versions:
+                new.update(versions)
+        new.difference_update(self._keys)
+        keys = self._keys
+        compute = self._compute
+        for v in new:
+            keys[v] = compute(v)
+
+    def get(self, v):
+        try:
+            return self._keys[v]
+        except KeyError:
+            result = self._keys[v] = self._compute(v)
+            return result
+
+    def legacy(self, v):
+        try:
+            return self._legacy_keys[v]
+        except KeyError:
+            key = self._legacy_keys[v] = legacy_key(v)
+            return key
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _compute(self, v):
+        s = v
+        try:
+            k = self.sort_key(v)
+        except Exception:
+            s = suggest_normalized_version(v)
+            if not s:
+                return None, None, False
+            try:
+                k = self.sort_key(s)
+            except ValueError:
+                return None, s, False
+        return k, s, is_release_version(s)
+
+# Indexes of the categories of Analysis.categories
+(COMPATIBLE, TRANSLATED, FILTERED, INCOMPATIBLE, SORT_ERROR_TRANSLATED,
+ SORT_ERROR_COMPATIBLE, NULL) = range(7)
+
+CATEGORY_TITLES = [
+    "Compatible",
+    "Compatible with translation",
+    "Compatible with filtering",
+    "No compatible versions",
+    "Sorts differently (after translations)",
+    "Sorts differently (no translations)",
+    "No applicable versions",
+]
+
+# Number of projects handed to a worker process at a time, and number of
+# chunks handed out ahead of the one being merged
+CHUNK_SIZE = 1000
+MAX_PENDING_CHUNKS = 32
+
+def classify(pname, versions, keys, releases_only=False, log=logger):
+    """Return the index of the category project `pname` belongs to."""
+    if not versions:
+        log.debug('%-15.15s has no versions', pname)
+        return NULL
+    # list_legacy and list_pep will contain 2-tuples
+    # comprising a sortable representation according to either
+    # the setuptools (legacy) algorithm or the PEP algorithm.
+    # followed by the original version string
+    # Go through the PEP 386/426 stuff one by one, since
+    # we might get failures
+    list_pep = []
+    release_versions = set()
+    prerelease_versions = set()
+    excluded_versions = set()
+    translated_versions = set()
+    for v in versions:
+        k, s, is_release = keys.get(v)
+        if k is None:
+            if s is None:
+                log.debug('%-15.15s failed for %r, no suggestions', pname, v)
+            else:
+                log.error('%-15.15s failed for %r, with suggestion %r',
+                          pname, v, s)
+            excluded_versions.add(v)
+            continue
+        if s != v:
+            log.debug('%-15.15s translated %r to %r', pname, v, s)
+            translated_versions.add(v)
+        if is_release:
+            release_versions.add(v)
+        else:
+            prerelease_versions.add(v)
+            if releases_only:
+                log.debug('%-15.15s ignoring pre-release %r', pname, s)
+                continue
+        list_pep.append((k, v))
+    if releases_only and prerelease_versions and not release_versions:
+        log.debug('%-15.15s has no release versions', pname)
+        return NULL
+    if not list_pep:
+        log.debug('%-15.15s has no compatible versions', pname)
+        return INCOMPATIBLE
+    # The legacy approach doesn't refuse the temptation to guess,
+    # so it *always* gives some kind of answer
+    if releases_only:
+        excluded_versions |= prerelease_versions
+    accepted_versions = set(versions) - excluded_versions
+    list_legacy = [(keys.legacy(v), v) for v in accepted_versions]
+    assert len(list_legacy) == len(list_pep)
+    sorted_legacy = sorted(list_legacy)
+    sorted_pep = sorted(list_pep)
+    sv_legacy = [t[1] for t in sorted_legacy]
+    sv_pep = [t[1] for t in sorted_pep]
+    if sv_legacy != sv_pep:
+        if translated_versions:
+            log.debug('%-15.15s translation creates sort differences', pname)
+            category = SORT_ERROR_TRANSLATED
+        else:
+            log.debug('%-15.15s incompatible due to sort errors', pname)
+            category = SORT_ERROR_COMPATIBLE
+        log.debug('%-15.15s unequal: legacy: %s', pname, sv_legacy)
+        log.debug('%-15.15s unequal: pep%s: %s', pname, pepno, sv_pep)
+        return category
+    # The project is compatible to some degree,
+    if excluded_versions:
+        log.debug('%-15.15s has some compatible versions', pname)
+        return FILTERED
+    if translated_versions:
+        log.debug('%-15.15s is compatible after translation', pname)
+        return TRANSLATED
+    log.debug('%-15.15s is fully compatible', pname)
+    return COMPATIBLE
+
+class _LogBuffer:
+    """Stands in for the logger in a worker process: keeps the messages
+    of the enabled levels, formatted, as (level, message) pairs for the
+    parent."""
+
+    def __init__(self, level):
+        self.level = level
+        self.messages = []
+
+    def log(self, level, msg, *args):
+        if level >= self.level:
+            self.messages.append((level, msg % args))
+
+    def debug(self, msg, *args):
+        self.log(logging.DEBUG, msg, *args)
+
+    def error(self, msg, *args):
+        self.log(logging.ERROR, msg, *args)
+
+def _init_worker(keys, worker_pepno, level):
+    global pepno, _worker_keys, _worker_log
+    pepno = worker_pepno
+    _worker_keys = keys
+    _worker_log = _LogBuffer(level)
+
+def _classify_chunk(chunk, releases_only):
+    """Classify the (name, versions) pairs of `chunk` in a worker process.
+
+    Return the names in each category and the messages logged meanwhile.
+    """
+    _worker_log.messages = []
+    parts = [set() for _ in CATEGORY_TITLES]
+    for pname, versions in chunk:
+        category = classify(pname, versions, _worker_keys, releases_only,
+                            _worker_log)
+        parts[category].add(pname)
+    return parts, _worker_log.messages
+
+def _replay(messages):
+    # One record for each run of messages of the same level rather than
+    # one per message, one line each with the '%(message)s' format
+    for level, run in itertools.groupby(messages, operator.itemgetter(0)):
+        logger.log(level, '%s', '\n'.join(message for _, message in run))
+
+def make_executor(jobs, keys):
+    """Return a process pool for Analysis, its workers sharing `keys`."""
+    return ProcessPoolExecutor(jobs, initializer=_init_worker,
+                               initargs=(keys, pepno,
+                                         logger.getEffectiveLevel()))
+
+def _chunks(items, size):
+    items = iter(items)
+    while True:
+        chunk = list(itertools.islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+def _map_chunks(executor, chunks, releases_only):
+    # Like executor.map(), but with at most MAX_PENDING_CHUNKS chunks in
+    # flight so that lazily loaded projects are not all read up front
+    pending = collections.deque()
+    for chunk in chunks:
+        pending.append(executor.submit(_classify_chunk, chunk, releases_only))
+        if len(pending) >= MAX_PENDING_CHUNKS:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
 class Analysis:
 
-    def __init__(self, title, projects, releases_only=False):
+    def __init__(self, title, projects, releases_only=False, keys=None,
+                 executor=None):
+        """Sort the projects into categories.
+
+        With an `executor` from make_executor(), projects are classified
+        by its worker processes, CHUNK_SIZE at a time.  Their log messages
+        are replayed in project order, so the report and the log are the
+        same as without.
+        """
         self.title = title
         self.projects = projects
 
         num_projects = len(projects)
 
-        compatible_projects = Category("Compatible", num_projects)
-        translated_projects = Category("Compatible with translation", num_projects)
-        filtered_projects = Category("Compatible with filtering", num_projects)
-        incompatible_projects = Category("No compatible versions", num_projects)
-        sort_error_translated_projects = Category("Sorts differently (after translations)", num_projects)
-        sort_error_compatible_projects = Category("Sorts differently (no translations)", num_projects)
-        null_projects = Category("No applicable versions", num_projects)
-
-        self.categories = [
-            compatible_projects,
-            translated_projects,
-            filtered_projects,
-            incompatible_projects,
-            sort_error_translated_projects,
-            sort_error_compatible_projects,
-            null_projects,
-        ]
-
-        sort_key = SORT_KEYS[pepno]
-        sort_failures = 0
-        for i, (pname, versions) in enumerate(projects.items()):
-            if i % 100 == 0:
-                sys.stderr.write('%s / %s\r' % (i, num_projects))
-                sys.stderr.flush()
-            if not versions:
-                logger.debug('%-15.15s has no versions', pname)
-                null_projects.add(pname)
-                continue
-            # list_legacy and list_pep will contain 2-tuples
-            # comprising a sortable representation according to either
-            # the setuptools (legacy) algorithm or the PEP algorithm.
-            # followed by the original version string
-            # Go through the PEP 386/426 stuff one by one, since
-            # we might get failures
-            list_pep = []
-            release_versions = set()
-            prerelease_versions = set()
-            excluded_versions = set()
-            translated_versions = set()
-            for v in versions:
-                s = v
-                try:
-                    k = sort_key(v)
-                except Exception:
-                    s = suggest_normalized_version(v)
-                    if not s:
-                        good = False
-                        logger.debug('%-15.15s failed for %r, no suggestions', pname, v)
-                        excluded_versions.add(v)
-                        continue
-                    else:
-                        try:
-                            k = sort_key(s)
-                        except ValueError:
-                            logger.error('%-15.15s failed for %r, with suggestion %r',
-                                         pname, v, s)
-                            excluded_versions.add(v)
-                            continue
-                    logger.debug('%-15.15s translated %r to %r', pname, v, s)
-                    translated_versions.add(v)
-                if is_release_version(s):
-                    release_versions.add(v)
-                else:
-                    prerelease_versions.add(v)
-                    if releases_only:
-                        logger.debug('%-15.15s ignoring pre-release %r', pname, s)
-                        continue
-                list_pep.append((k, v))
-            if releases_only and prerelease_versions and not release_versions:
-                logger.debug('%-15.15s has no release versions', pname)
-                null_projects.add(pname)
-                continue
-            if not list_pep:
-                logger.debug('%-15.15s has no compatible versions', pname)
-                incompatible_projects.add(pname)
-                continue
-            # The legacy approach doesn't refuse the temptation to guess,
-            # so it *always* gives some kind of answer
-            if releases_only:
-                excluded_versions |= prerelease_versions
-            accepted_versions = set(versions) - excluded_versions
-            list_legacy = [(legacy_key(v), v) for v in accepted_versions]
-            assert len(list_legacy) == len(list_pep)
-            sorted_legacy = sorted(list_legacy)
-            sorted_pep = sorted(list_pep)
-            sv_legacy = [t[1] for t in sorted_legacy]
-            sv_pep = [t[1] for t in sorted_pep]
-            if sv_legacy != sv_pep:
-                if translated_versions:
-                     logger.debug('%-15.15s translation creates sort differences', pname)
-                     sort_error_translated_projects.add(pname)
-                else:
-                     logger.debug('%-15.15s incompatible due to sort errors', pname)
-                     sort_error_compatible_projects.add(pname)
-                logger.debug('%-15.15s unequal: legacy: %s', pname, sv_legacy)
-                logger.debug('%-15.15s unequal: pep%s: %s', pname, pepno, sv_pep)
-                continue
-            # The project is compatible to some degree,
-            if excluded_versions:
-                logger.debug('%-15.15s has some compatible versions', pname)
-                filtered_projects.add(pname)
-                continue
-            if translated_versions:
-                logger.debug('%-15.15s is compatible after translation', pname)
-                translated_projects.add(pname)
-                continue
-            logger.debug('%-15.15s is fully compatible', pname)
-            compatible_projects.add(pname)
+        self.categories = [Category(title, num_projects)
+                           for title in CATEGORY_TITLES]
+
+        if keys is None:
+            keys = VersionKeys(SORT_KEYS[pepno])
+        if executor is None:
+            for i, (pname, versions) in enumerate(projects.items()):
+                if i % 100 == 0:
+                    sys.stderr.write('%s / %s\r' % (i, num_projects))
+                    sys.stderr.flush()
+                category = classify(pname, versions, keys, releases_only)
+                self.categories[category].add(pname)
+            return
+
+        results = _map_chunks(executor, _chunks(projects.items(), CHUNK_SIZE),
+                              releases_only)
+        for i, (parts, messages) in enumerate(results):
+            sys.stderr.write('%s / %s\r' % (i * CHUNK_SIZE, num_projects))
+            sys.stderr.flush()
+            _replay(messages)
+            for category, part in zip(self.categories, parts):
+                category |= part
 
     def print_report(self):
         print("Analysing {}".format(self.title))
@@ -242,29 +658,58 @@ class Analysis:
             print(" ", category)
 
 
-def main(pepno = '426'):
+def main(pepno = '426', url=PYPI_URL, cache_name=VERSION_CACHE, jobs=1):
     print('Comparing PEP %s version sort to setuptools.' % pepno)
 
-    projects, public = get_projects(VERSION_CACHE)
-    print()
-    Analysis("release versions", public, releases_only=True).print_report()
-    print()
-    Analysis("public versions", public).print_report()
-    print()
-    Analysis("all versions", projects).print_report()
+    projects, public = get_projects(cache_name, url)
+    # Public versions are among all versions, so keying all of them up
+    # front covers the three analyses
+    keys = VersionKeys(SORT_KEYS[pepno])
+    keys.update(projects)
+    logger.info('%d distinct versions', len(keys))
+    executor = make_executor(jobs or None, keys) if jobs != 1 else None
+    try:
+        print()
+        Analysis("release versions", public, releases_only=True,
+                 keys=keys, executor=executor).print_report()
+        print()
+        Analysis("public versions", public, keys=keys,
+                 executor=executor).print_report()
+        print()
+        Analysis("all versions", projects, keys=keys,
+                 executor=executor).print_report()
+    finally:
+        if executor is not None:
+            executor.shutdown()
     # Uncomment the line below to explore differences in details
     # import pdb; pdb.set_trace()
     # Grepping the log files is also informative
     # e.g. "grep unequal pep426sort.log" for the PEP 426 sort differences
 
 if __name__ == '__main__':
-    if len(sys.argv) > 1 and sys.argv[1] == '386':
-        pepno = '386'
-    else:
-        pepno = '426'
+    parser = argparse.ArgumentParser(
+        description="Compare a PEP version sort to setuptools.")
+    parser.add_argument('pepno', nargs='?', choices=('386', '426'),
+                        default='426', help="PEP to compare (default: 426)")
+    parser.add_argument('--url', default=PYPI_URL,
+                        help="XML-RPC index the versions are retrieved from "
+                             "when the cache doesn't exist "
+                             "(default: %(default)s)")
+    parser.add_argument('--cache', default=VERSION_CACHE,
+                        help="versions cache (default: %(default)s); with a "
+                             "name ending in .sqlite, projects are read from "
+                             "an SQLite database as needed instead of all "
+                             "loaded up front, and the database is converted "
+                             "from the JSON cache of the same name when it "
+                             "doesn't exist")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="number of worker processes for the analyses; "
+                             "0 for one per CPU (default: 1, no workers)")
+    args = parser.parse_args()
+    pepno = args.pepno
     logname = 'pep{}sort.log'.format(pepno)
     logging.basicConfig(level=logging.DEBUG, filename=logname,
                         filemode='w', format='%(message)s')
     logger.setLevel(logging.DEBUG)
-    main(pepno)
+    main(pepno, args.url, args.cache, args.jobs)
 
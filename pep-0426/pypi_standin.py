@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+
+# Local stand-in for the PyPI XML-RPC interface used by pepsort.py
+#
+# Serves list_packages() and package_releases() (plus system.multicall)
+# for a synthetic catalogue of projects whose version strings mix PEP 426
+# versions, versions that need translating and ones that can't be.  It
+# can add latency to every request and answer some with HTTP 503, to
+# exercise the retries in pepsort.fetch_projects().
+#
+#   python3 pypi_standin.py --packages 20000 --port 8426
+#   python3 pepsort.py --url http://localhost:8426
+#
+# With --benchmark, the server runs in a thread and the time
+# pepsort.fetch_projects() takes is printed for a few settings.
+# 2000 packages, 5 ms latency per request, Python 3.11, Linux:
+#
+#   workers  batch   seconds
+#         1      1     13.72   (one project per request)
+#         1     50      0.64
+#         8      1      3.37
+#         8     50      0.26
+#
+# Retrieving versions one project at a time, as pepsort did before, takes
+# two requests per project and a 10 ms sleep between projects: about 40 s.
+
+import argparse
+import os
+import random
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+from xmlrpc.server import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+
+# Templates of the version strings in the synthetic catalogue; the last
+# ones aren't PEP 426 versions, with or without suggestions.
+VERSION_FORMATS = [
+    '{major}.{minor}',
+    '{major}.{minor}.{micro}',
+    '{major}.{minor}a{n}',
+    '{major}.{minor}b{n}',
+    '{major}.{minor}rc{n}',
+    '{major}.{minor}.dev{n}',
+    '{major}.{minor}.post{n}',
+    '{major}.{minor}.{micro}.dev{n}',
+    '{major}.{minor}-beta',
+    '{major}.{minor}.{micro}-r{n}',
+    '{major}.{minor}pre{n}',
+    '{major}.{minor}-final',
+    '{year}{month:02d}{day:02d}',
+    'r{n}',
+    'dev',
+]
+
+def make_catalogue(num_packages, seed=0):
+    """Return {name: (all versions, public versions)} for `num_packages`.
+
+    The same `seed` always gives the same catalogue.
+    """
+    rnd = random.Random(seed)
+    catalogue = {}
+    for i in range(num_packages):
+        name = 'project-%05d' % i
+        versions = []
+        for _ in range(int(rnd.expovariate(1 / 6.0))):
+            fmt = rnd.choice(VERSION_FORMATS)
+            version = fmt.format(
+                major=rnd.randint(0, 4), minor=rnd.randint(0, 12),
+                micro=rnd.randint(0, 9), n=rnd.randint(1, 20),
+                year=rnd.randint(2000, 2013), month=rnd.randint(1, 12),
+                day=rnd.randint(1, 28))
+            if version not in versions:
+                versions.append(version)
+        # like PyPI, only show the latest release unless asked for all
+        catalogue[name] = (versions, versions[-1:])
+    return catalogue
+
+class StandinHandler(SimpleXMLRPCRequestHandler):
+
+    rpc_paths = ('/', '/pypi', '/RPC2')
+
+    def do_POST(self):
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+        if server.error_rate and server.random.random() < server.error_rate:
+            self.send_error(503)
+            return
+        super().do_POST()
+
+    def log_error(self, format, *args):
+        # the injected errors are expected, don't report each of them
+        pass
+
+class StandinServer(socketserver.ThreadingMixIn, SimpleXMLRPCServer):
+    """XML-RPC server answering for the projects in `catalogue`."""
+
+    daemon_threads = True
+
+    def __init__(self, catalogue, address=('localhost', 0), latency=0.0,
+                 error_rate=0.0):
+        super().__init__(address, StandinHandler, logRequests=False,
+                         allow_none=True)
+        self.catalogue = catalogue
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(0)
+        self.register_function(self.list_packages, 'list_packages')
+        self.register_function(self.package_releases, 'package_releases')
+        self.register_multicall_functions()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return 'http://%s:%d/pypi' % (host, port)
+
+    def list_packages(self):
+        return list(self.catalogue)
+
+    def package_releases(self, name, show_hidden=False):
+        versions, public = self.catalogue.get(name, ([], []))
+        return versions if show_hidden else public
+
+def benchmark(num_packages, latency):
+    # pepsort needs distlib, which the server itself doesn't
+    import pepsort
+
+    catalogue = make_catalogue(num_packages)
+    server = StandinServer(catalogue, latency=latency)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    print("%d packages, %g ms latency per request" %
+          (num_packages, latency * 1000))
+    print("  workers  batch   seconds")
+    try:
+        for workers, batch_size in ((1, 1), (1, 50), (8, 1), (8, 50)):
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                cache_name = os.path.join(tmp_dir, 'cache.json')
+                start = time.perf_counter()
+                projects, public = pepsort.fetch_projects(
+                    cache_name, server.url, workers=workers,
+                    batch_size=batch_size)
+                elapsed = time.perf_counter() - start
+            assert projects == dict((name, versions) for name, (versions, _)
+                                    in catalogue.items())
+            print("  %7d  %5d  %8.2f" % (workers, batch_size, elapsed))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description="Serve a synthetic package catalogue over the PyPI "
+                    "XML-RPC interface.")
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8426)
+    parser.add_argument('--packages', type=int, default=20000,
+                        help="number of projects (default: %(default)s)")
+    parser.add_argument('--seed', type=int, default=0,
+                        help="seed of the catalogue (default: %(default)s)")
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help="seconds to wait before answering a request")
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help="fraction of requests answered with HTTP 503")
+    parser.add_argument('--benchmark', action='store_true',
+                        help="time pepsort.fetch_projects() against a server "
+                             "running in a thread instead")
+    args = parser.parse_args(argv[1:])
+
+    if args.benchmark:
+        benchmark(args.packages, args.latency or 0.005)
+        return
+
+    server = StandinServer(make_catalogue(args.packages, args.seed),
+                           (args.host, args.port), args.latency,
+                           args.error_rate)
+    print("Serving %d packages at %s" % (args.packages, server.url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -5,13 +5,37 @@ Example usage:
 
     $ find /usr/lib/python3.4 -name '*.py' | xargs python3 find-pep505.py
 
+All detectors run during one traversal of each module; add --benchmark to
+compare that with one traversal per detector.  With -j N, files are parsed
+and scanned by N worker processes; the output is the same as without.
+With --json, each match and each rule total is printed as a JSON object on
+a line of its own.
+
+The matches found in each file are cached in .find-pep505-cache.json (see
+--cache); files whose content didn't change since are not parsed again.
+
 '''
 
+import argparse
 import ast
 import glob
+import hashlib
+import json
 import os
 import sys
+import time
 import tokenize
+from concurrent.futures import ProcessPoolExecutor
+
+
+# Number of files handed to a worker process at a time.
+CHUNK_SIZE = 16
+
+# Match records of files already scanned, see `MatchCache`.
+CACHE_NAME = '.find-pep505-cache.json'
+
+# Bump whenever a visitor or RULES changes so that cached matches are dropped.
+RULES_VERSION = 1
 
 
 class NoneCoalesceIfBlockVisitor(ast.NodeVisitor):
@@ -331,30 +355,6 @@ class SafeNavTernaryVisitor(ast.NodeVisitor):
                 self.__callback(self.__file, ifexp.test.lineno, None)
 
 
-def count_calls_decorator(callback):
-    '''
-    Decorator for a callback that counts how many time that callback
-    was invoked.
-    '''
-
-    def invoke(*args):
-        callback(*args)
-        invoke.count += 1
-
-    invoke.count = 0
-
-    return invoke
-
-
-def get_call_count(invoke):
-    '''
-    In tandem with `count_calls_decorator`, return the number of times that
-    a callback was invoked.
-    '''
-
-    return invoke.count
-
-
 def get_name_from_node(node):
     '''
     Return the left-most name from an Attribute or Subscript node.
@@ -372,39 +372,276 @@ def get_name_from_node(node):
         return None
 
 
-def log(text, file_, start_line, stop_line=None):
+def log(text, file_, start_line, excerpt):
     '''
     Display a match, including file name, line number, and code excerpt.
     '''
 
     print('{}: {}:{}'.format(text, file_, start_line))
+    print(excerpt)
 
-    if stop_line is None:
-        stop_line = start_line
+
+def log_json(text, file_, start_line, stop_line, excerpt):
+    '''
+    Display a match as one line of JSON.
+    '''
+
+    print(json.dumps({'type': 'match', 'rule': text, 'file': file_,
+                      'start': start_line, 'stop': stop_line,
+                      'source': excerpt}))
+
+
+# The detectors, in the order their matches and totals are printed:
+# (visitor class, match label, total line).
+RULES = [
+    (NoneCoalesceIfBlockVisitor, 'None-coalescing `if` block',
+     'Total None-coalescing `if` blocks: {}'),
+    (NoneCoalesceOrVisitor, '[Possible] None-coalescing `or`',
+     'Total [possible] None-coalescing `or`: {}'),
+    (NoneCoalesceTernaryVisitor, 'None-coalescing ternary',
+     'Total None-coalescing ternaries: {}'),
+    (SafeNavAndVisitor, 'Safe navigation `and`',
+     'Total Safe navigation `and`: {}'),
+    (SafeNavIfBlockVisitor, 'Safe navigation `if` block',
+     'Total Safe navigation `if` blocks: {}'),
+    (SafeNavTernaryVisitor, 'Safe navigation ternary',
+     'Total Safe navigation ternaries: {}'),
+]
+
+
+class FusedVisitor:
+    '''
+    Run the `visit_*` methods of several visitors in one traversal of a tree.
+
+    Each `visit_X` method is registered as a rule for nodes of type X. The
+    visitors above don't visit the children of the nodes they handle, so
+    a rule for X never sees the X nodes nested in another X node; the
+    traversal keeps track of that for each node type.
+    '''
+
+    def __init__(self, visitors):
+        self.rules = {}
+        for visitor in visitors:
+            for name in dir(visitor):
+                if name.startswith('visit_'):
+                    self.rules.setdefault(name[len('visit_'):], []).append(
+                        getattr(visitor, name))
+
+    def visit(self, tree):
+        rules = self.rules
+        stack = [(tree, frozenset())]
+        while stack:
+            node, blocked = stack.pop()
+            name = type(node).__name__
+            if name in rules and name not in blocked:
+                for rule in rules[name]:
+                    rule(node)
+                blocked = blocked | {name}
+                if len(blocked) == len(rules):
+                    # No rule can match below this node.
+                    continue
+            children = list(ast.iter_child_nodes(node))
+            children.reverse()
+            stack.extend((child, blocked) for child in children)
+
+
+def find_matches(tree, file_):
+    '''
+    Return the matches of all rules in `tree` as `(rule index, file, start
+    line, stop line)` tuples, in the order the separate visitors would find
+    them: rule by rule, each in tree order.
+    '''
+
+    matches = [[] for _ in RULES]
+    visitors = [
+        visitor_class(file_, lambda *args, index=index:
+                      matches[index].append((index,) + args))
+        for index, (visitor_class, _, _) in enumerate(RULES)
+    ]
+    FusedVisitor(visitors).visit(tree)
+    return [match for rule_matches in matches for match in rule_matches]
+
+
+def parse_file(file_):
+    '''
+    Return the AST of `file_` and its decoded source lines, or None if it
+    can't be decoded or parsed.
+    '''
 
     try:
         source = tokenize.open(file_)
     except (SyntaxError, UnicodeDecodeError):
-        return
+        return None
 
     with source:
-        print(''.join(source.readlines()[start_line-1:stop_line]))
+        try:
+            lines = source.readlines()
+            return ast.parse(''.join(lines), filename=file_), lines
+        except (SyntaxError, UnicodeDecodeError):
+            return None
+
+
+def scan_file(file_):
+    '''
+    Return `(matches, counts)` for `file_`: its matches as `(rule index,
+    file, start line, stop line, code excerpt)` tuples, in output order, and
+    the number of matches of each rule.
+
+    Files that can't be parsed have no matches.  This runs in the worker
+    processes with -j.
+    '''
+
+    counts = [0] * len(RULES)
+    parsed = parse_file(file_)
+    if parsed is None:
+        return [], counts
+
+    tree, lines = parsed
+    matches = []
+    for index, file_, start, stop in find_matches(tree, file_):
+        if stop is None:
+            stop = start
+        matches.append((index, file_, start, stop,
+                        ''.join(lines[start-1:stop])))
+        counts[index] += 1
+    return matches, counts
+
+
+class MatchCache:
+    '''
+    Match records of the files scanned before, kept between runs.
+
+    Entries are found by the SHA-1 of a file's content and don't include the
+    file name, so a moved or copied file is still a hit.  The whole cache is
+    dropped when the Python version (the AST differs between versions) or
+    `RULES_VERSION` changes, and the entries a run didn't look up (those of
+    edited or removed files) when it saves the cache.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.hits = self.misses = 0
+        self.changed = False
+        self.used = set()
+        self.python = '{}.{}'.format(*sys.version_info[:2])
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        if data.get('version') == RULES_VERSION and \
+                data.get('python') == self.python:
+            self.files = data['files']
+        else:
+            self.files = {}
+
+    @staticmethod
+    def digest(file_):
+        with open(file_, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()
+
+    def lookup(self, digest, file_):
+        '''
+        Return the cached `scan_file()` result of `file_`, or None.
+        '''
+
+        self.used.add(digest)
+        entry = self.files.get(digest)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        counts = [0] * len(RULES)
+        matches = []
+        for index, start, stop, excerpt in entry:
+            matches.append((index, file_, start, stop, excerpt))
+            counts[index] += 1
+        return matches, counts
+
+    def store(self, digest, result):
+        matches, _ = result
+        self.used.add(digest)
+        self.files[digest] = [[index, start, stop, excerpt]
+                              for index, _, start, stop, excerpt in matches]
+        self.changed = True
+
+    def save(self):
+        for digest in set(self.files) - self.used:
+            del self.files[digest]
+            self.changed = True
+        if not self.changed:
+            return
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'version': RULES_VERSION, 'python': self.python,
+                       'files': self.files}, f, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+        self.changed = False
+
+
+def benchmark(files):
+    '''
+    Time one traversal per visitor against the fused traversal, over the
+    trees of `files` (parsing is not timed).
+    '''
+
+    trees = [(file_, parsed[0]) for file_, parsed in
+             ((file_, parse_file(file_)) for file_ in files)
+             if parsed is not None]
+
+    def separate():
+        counts = [0] * len(RULES)
+        for file_, tree in trees:
+            for index, (visitor_class, _, _) in enumerate(RULES):
+                def callback(*args, index=index):
+                    counts[index] += 1
+                visitor_class(file_, callback).visit(tree)
+        return counts
+
+    def fused():
+        counts = [0] * len(RULES)
+        for file_, tree in trees:
+            for match in find_matches(tree, file_):
+                counts[match[0]] += 1
+        return counts
+
+    results = []
+    for label, walk in (('separate', separate), ('fused', fused)):
+        best = None
+        for run in range(3):
+            start = time.perf_counter()
+            counts = walk()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results.append(counts)
+        print('{:8} {:.3f} s for {} files, counts {}'
+              .format(label, best, len(trees), counts))
+    assert results[0] == results[1], 'fused traversal counts differ'
 
 
 def main():
-    def make_callback(text):
-        return count_calls_decorator(
-            lambda file_, start, stop: log(text, file_, start, stop)
-        )
-
-    nci_callback = make_callback('None-coalescing `if` block')
-    nco_callback = make_callback('[Possible] None-coalescing `or`')
-    nct_callback = make_callback('None-coalescing ternary')
-    sna_callback = make_callback('Safe navigation `and`')
-    sni_callback = make_callback('Safe navigation `if` block')
-    snt_callback = make_callback('Safe navigation ternary')
-
-    files = sys.argv[1:]
+    parser = argparse.ArgumentParser(
+        description='Find code patterns that PEP-505 attempts to make more '
+                    'concise.')
+    parser.add_argument('files', nargs='*', metavar='FILE',
+                        help='files to scan; may be glob patterns '
+                             '(default: the Python library)')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='number of worker processes; 0 for one per '
+                             'CPU (default: 1, no workers)')
+    parser.add_argument('--cache', metavar='FILE', default=CACHE_NAME,
+                        help='match cache (default: %(default)s); pass an '
+                             'empty string to disable it')
+    parser.add_argument('--json', action='store_true',
+                        help='print one JSON object per line for each match '
+                             'and each rule total')
+    parser.add_argument('--benchmark', action='store_true',
+                        help='time the fused traversal against one '
+                             'traversal per visitor instead')
+    args = parser.parse_args()
+
+    files = args.files
     if files:
         expanded_files = []
         for file_ in files:
@@ -412,45 +649,65 @@ def main():
                 expanded_files.extend(glob.glob(file_))
             else:
                 expanded_files.append(file_)
+        files = expanded_files
     else:
         files = glob.glob(os.path.join(sys.prefix, 'Lib', '**', '*.py'))
 
-    for file_ in files:
-        try:
-            source = tokenize.open(file_)
-        except (SyntaxError, UnicodeDecodeError):
-            continue
-
-        with source:
-            try:
-                tree = ast.parse(source.read(), filename=file_)
-            except SyntaxError:
-                continue
-
-            NoneCoalesceIfBlockVisitor(file_, nci_callback).visit(tree)
-            NoneCoalesceOrVisitor(file_, nco_callback).visit(tree)
-            NoneCoalesceTernaryVisitor(file_, nct_callback).visit(tree)
-            SafeNavAndVisitor(file_, sna_callback).visit(tree)
-            SafeNavIfBlockVisitor(file_, sni_callback).visit(tree)
-            SafeNavTernaryVisitor(file_, snt_callback).visit(tree)
-
-    print('Total None-coalescing `if` blocks: {}'
-          .format(get_call_count(nci_callback)))
-
-    print('Total [possible] None-coalescing `or`: {}'
-          .format(get_call_count(nco_callback)))
-
-    print('Total None-coalescing ternaries: {}'
-          .format(get_call_count(nct_callback)))
-
-    print('Total Safe navigation `and`: {}'
-          .format(get_call_count(sna_callback)))
+    if args.benchmark:
+        benchmark(files)
+        return
 
-    print('Total Safe navigation `if` blocks: {}'
-          .format(get_call_count(sni_callback)))
+    cache = MatchCache(args.cache) if args.cache else None
+    digests = {}
+    cached = {}
+    if cache is not None:
+        for file_ in files:
+            digest = digests[file_] = cache.digest(file_)
+            result = cache.lookup(digest, file_)
+            if result is not None:
+                cached[file_] = result
+    todo = [file_ for file_ in files if file_ not in cached]
+
+    # Files are scanned in parallel but reported on in the order a serial
+    # run visits them.
+    executor = None
+    if args.jobs != 1 and todo:
+        executor = ProcessPoolExecutor(args.jobs or None)
+        results = executor.map(scan_file, todo, chunksize=CHUNK_SIZE)
+    else:
+        results = map(scan_file, todo)
 
-    print('Total Safe navigation ternaries: {}'
-          .format(get_call_count(snt_callback)))
+    totals = [0] * len(RULES)
+    try:
+        for file_ in files:
+            if file_ in cached:
+                matches, counts = cached[file_]
+            else:
+                matches, counts = result = next(results)
+                if cache is not None:
+                    cache.store(digests[file_], result)
+            for index, file_, start, stop, excerpt in matches:
+                if args.json:
+                    log_json(RULES[index][1], file_, start, stop, excerpt)
+                else:
+                    log(RULES[index][1], file_, start, excerpt)
+            totals = [total + count for total, count in zip(totals, counts)]
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    if cache is not None:
+        cache.save()
+        lookups = cache.hits + cache.misses
+        sys.stderr.write('cache: {} hits, {} misses ({:.0%} hit rate)\n'
+                         .format(cache.hits, cache.misses,
+                                 cache.hits / lookups if lookups else 0))
+
+    for count, (_, text, total) in zip(totals, RULES):
+        if args.json:
+            print(json.dumps({'type': 'total', 'rule': text, 'count': count}))
+        else:
+            print(total.format(count))
 
 
 if __name__ == '__main__':
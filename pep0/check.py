@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""Check PEP sources without building anything.
+
+Runs the header validation done by PEP (header order, required headers,
+Type and Status values, Active/Provisional rules, authors), the checks
+pep2html.py does while rendering (Content-Type, PEP numbers in the
+Requires/Replaces/Superseded-By headers and, for reStructuredText PEPs,
+header field bodies that are a single paragraph), and the corpus level
+checks: file name and PEP number agree, and cross-references point at an
+existing PEP.  Like pep2html.py, the reStructuredText checks need docutils;
+without it they are skipped.
+
+The verdict for each file is cached by the SHA-1 of its contents, so a run
+only parses the PEPs that changed since the previous one.  Cross-references
+are resolved against the PEP files on disk on every run.
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+import argparse
+import hashlib
+import io
+import json
+import os
+import re
+
+from concurrent.futures import ProcessPoolExecutor
+from email.parser import HeaderParser
+
+try:
+    from docutils import frontend, nodes, utils
+    from docutils.parsers import rst
+except ImportError:
+    rst = None
+
+from .pep import PEP, PEPError, find_pep_files
+
+
+CACHE_NAME = '.pep-check-cache'
+
+# Bump whenever the checks change so that cached verdicts are dropped.
+CHECK_VERSION = 2
+
+# Uncached files below this count are checked in-process; starting a pool
+# costs more than it saves.
+MIN_PARALLEL = 32
+
+content_types = (u'text/plain', u'text/x-rst')
+reference_headers = ('Requires', 'Replaces', 'Superseded-By')
+
+
+def pep_number_from_path(path):
+    """Return the PEP number encoded in the file name, or None."""
+    try:
+        return int(os.path.basename(path)[4:-4])
+    except ValueError:
+        return None
+
+
+def check_rst_header(path, text):
+    """Return the errors pep2html.py would raise rendering the header of
+    the reStructuredText PEP `text`: every field body must be a single
+    paragraph.
+    """
+    header = []
+    for line in text.splitlines():
+        if not line.strip():
+            break
+        header.append(line)
+    try:
+        settings = frontend.get_default_settings(rst.Parser)
+    except AttributeError:
+        # docutils < 0.19
+        settings = frontend.OptionParser(
+            components=(rst.Parser,)).get_default_values()
+    # as set by pep2html.py's PEPReader; keep every message in the tree
+    settings.pep_references = settings.rfc_references = 1
+    settings.report_level = utils.Reporter.SEVERE_LEVEL + 1
+    settings.halt_level = utils.Reporter.SEVERE_LEVEL + 1
+    document = utils.new_document(path, settings)
+    rst.Parser(rfc2822=True).parse('\n'.join(header), document)
+    if not len(document) or \
+            not isinstance(document[0], nodes.field_list) or \
+            'rfc2822' not in document[0]['classes']:
+        return ['does not begin with an RFC-2822 header']
+    errors = []
+    for field in document[0]:
+        body = field[1]
+        if len(body) > 1:
+            errors.append('%s header field body contains multiple elements'
+                          % (field[0].astext(),))
+        elif len(body) == 1 and not isinstance(body[0], nodes.paragraph):
+            errors.append('%s header field body is not a single paragraph'
+                          % (field[0].astext(),))
+    return errors
+
+
+def check_source(path, data):
+    """Check the PEP source `data` (bytes) read from `path`.
+
+    Return ``(references, errors)``: the PEP numbers named in the reference
+    headers and a list of error messages.
+    """
+    errors = []
+    try:
+        text = data.decode('utf-8')
+    except UnicodeDecodeError as e:
+        return [], ['not valid UTF-8: %s' % (e,)]
+    pep_file = io.StringIO(text, newline=None)
+    pep_file.name = path
+    try:
+        pep = PEP(pep_file)
+    except PEPError as e:
+        errors.append(e.args[0])
+        number = None
+    except Exception as e:
+        errors.append('unexpected error parsing headers: %r' % (e,))
+        number = None
+    else:
+        number = pep.number
+    if number is not None and number != pep_number_from_path(path):
+        errors.append('PEP number does not match file name')
+
+    metadata = HeaderParser().parsestr(text, headersonly=True)
+    content_type = metadata['Content-Type']
+    if content_type is not None and content_type not in content_types:
+        errors.append('%r is not a valid Content-Type value' %
+                      (content_type,))
+    elif content_type == 'text/x-rst' and rst is not None:
+        errors.extend(check_rst_header(path, text))
+    references = []
+    for name in reference_headers:
+        value = metadata[name]
+        if value is None:
+            continue
+        for refpep in re.split(r',?\s+', value.strip()):
+            try:
+                references.append(int(refpep))
+            except ValueError:
+                errors.append('%s header contains %r, which is not a PEP '
+                              'number' % (name, refpep))
+    return references, errors
+
+
+def _check_path(path):
+    with open(path, 'rb') as pep_file:
+        data = pep_file.read()
+    return check_source(path, data)
+
+
+def _load_cache(cache_path):
+    try:
+        with open(cache_path) as cache_file:
+            cache = json.load(cache_file)
+    except (IOError, OSError, ValueError):
+        return {}
+    if cache.get('version') != CHECK_VERSION or \
+            cache.get('docutils') != (rst is not None):
+        return {}
+    return cache['files']
+
+
+def _save_cache(cache_path, files):
+    tmp_path = cache_path + '.tmp'
+    with open(tmp_path, 'w') as cache_file:
+        json.dump({'version': CHECK_VERSION, 'docutils': rst is not None,
+                   'files': files}, cache_file,
+                  separators=(',', ':'))
+    os.replace(tmp_path, cache_path)
+
+
+def check_peps(paths, known_numbers, cache_path=None, jobs=None):
+    """Check the PEP files in `paths`.
+
+    `known_numbers` is the set of existing PEP numbers cross-references
+    are resolved against.  Return a list of ``(path, message)`` pairs and
+    the number of files actually parsed (the others were cached).
+    """
+    cache = _load_cache(cache_path) if cache_path else {}
+    verdicts = {}
+    digests = {}
+    todo = []
+    for path in paths:
+        with open(path, 'rb') as pep_file:
+            digest = hashlib.sha1(pep_file.read()).hexdigest()
+        digests[path] = digest
+        entry = cache.get(os.path.basename(path))
+        if entry is not None and entry['digest'] == digest:
+            verdicts[path] = entry['references'], entry['errors']
+        else:
+            todo.append(path)
+
+    if jobs != 1 and len(todo) >= MIN_PARALLEL:
+        with ProcessPoolExecutor(jobs) as executor:
+            results = list(executor.map(_check_path, todo, chunksize=8))
+    else:
+        results = [_check_path(path) for path in todo]
+    for path, result in zip(todo, results):
+        verdicts[path] = result
+        references, errors = result
+        cache[os.path.basename(path)] = {'digest': digests[path],
+                                         'references': references,
+                                         'errors': errors}
+    if cache_path and todo:
+        _save_cache(cache_path, cache)
+
+    problems = []
+    for path in paths:
+        references, errors = verdicts[path]
+        for message in errors:
+            problems.append((path, message))
+        for refpep in references:
+            if refpep not in known_numbers:
+                problems.append((path, 'reference to missing PEP %d' %
+                                       (refpep,)))
+    return problems, len(todo)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        prog='genpepindex.py --check',
+        description="Check PEP headers and cross-references.")
+    parser.add_argument('paths', metavar='PATH', nargs='*',
+                        help="PEP files or directories of PEPs "
+                             "(default: current directory)")
+    parser.add_argument('--cache', metavar='FILE', default=CACHE_NAME,
+                        help="verdict cache (default: %(default)s); "
+                             "pass an empty string to disable it")
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help="number of worker processes "
+                             "(default: number of CPUs)")
+    args = parser.parse_args(argv)
+
+    paths = []
+    directories = set()
+    for path in args.paths or ['.']:
+        if os.path.isdir(path):
+            paths.extend(find_pep_files(path))
+            directories.add(path)
+        elif os.path.isfile(path):
+            basename = os.path.basename(path)
+            if basename.startswith('pep-0000.'):
+                continue
+            paths.append(path)
+            directories.add(os.path.dirname(path) or '.')
+        else:
+            parser.error("no such file or directory: %s" % (path,))
+    known_numbers = set()
+    for directory in directories:
+        for pep_path in find_pep_files(directory):
+            known_numbers.add(pep_number_from_path(pep_path))
+
+    problems, _ = check_peps(paths, known_numbers, args.cache or None,
+                             args.jobs)
+    for path, message in problems:
+        print("%s: %s" % (path, message))
+    return 1 if problems else 0
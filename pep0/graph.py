@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+"""Cross-reference graph of the PEPs.
+
+Every PEP is a node.  Its outgoing edges are the PEPs named in its
+Requires, Replaces and Superseded-By headers and the PEPs it mentions in
+its body ("PEP 8", ``:pep:`8```, "pep-0008.txt").  The graph is saved as
+JSON together with the reverse edges, so that "referenced by" lookups and
+target validation are plain dictionary lookups after loading.
+
+Nodes remember the digest of the source they were built from; updating the
+graph only rescans PEPs whose source changed.
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+import argparse
+import hashlib
+import json
+import os
+import re
+
+from email.parser import HeaderParser
+
+
+GRAPH_NAME = 'pep-graph.json'
+
+# Bump whenever the edge extraction changes so that saved nodes are rescanned.
+GRAPH_VERSION = 1
+
+REQUIRES = 'requires'
+REPLACES = 'replaces'
+SUPERSEDED_BY = 'superseded-by'
+MENTIONS = 'mentions'
+
+edge_kinds = (REQUIRES, REPLACES, SUPERSEDED_BY, MENTIONS)
+header_kinds = (('Requires', REQUIRES), ('Replaces', REPLACES),
+                ('Superseded-By', SUPERSEDED_BY))
+
+_mention_re = re.compile(r'\bPEP\s+(\d+)|:pep:`(\d+)`|\bpep-(\d{4})\b')
+
+
+def extract_edges(number, text):
+    """Return ``{kind: [pep numbers]}`` for the PEP source `text`."""
+    header, _, body = text.partition(u'\n\n')
+    metadata = HeaderParser().parsestr(header + u'\n\n', headersonly=True)
+    edges = {}
+    for name, kind in header_kinds:
+        value = metadata[name]
+        if value is None:
+            continue
+        targets = [int(refpep) for refpep in re.split(r',?\s+', value.strip())
+                   if refpep.isdigit()]
+        if targets:
+            edges[kind] = targets
+    mentions = set()
+    for match in _mention_re.finditer(body):
+        target = int(next(group for group in match.groups() if group))
+        if target != number:
+            mentions.add(target)
+    if mentions:
+        edges[MENTIONS] = sorted(mentions)
+    return edges
+
+
+class PEPGraph(object):
+
+    """Cross-reference graph of the PEPs.
+
+    Attributes:
+
+        + nodes : dict
+            Maps each PEP number to its node: a dict with its ``path``,
+            ``digest`` and one list of target PEP numbers per edge kind.
+
+        + reverse : dict
+            Maps each referenced PEP number to ``{kind: [source numbers]}``.
+    """
+
+    def __init__(self, nodes=None):
+        self.nodes = nodes or {}
+        self.changed = False
+        self._build_reverse()
+
+    @classmethod
+    def load(cls, path):
+        """Load the graph saved at `path`, or return an empty graph."""
+        try:
+            with open(path) as graph_file:
+                data = json.load(graph_file)
+        except (IOError, OSError, ValueError):
+            return cls()
+        if data.get('version') != GRAPH_VERSION:
+            return cls()
+        graph = cls.__new__(cls)
+        graph.nodes = dict((int(number), node)
+                           for number, node in data['nodes'].items())
+        graph.reverse = dict((int(number), sources)
+                             for number, sources in data['reverse'].items())
+        graph.changed = False
+        return graph
+
+    def save(self, path):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as graph_file:
+            json.dump({'version': GRAPH_VERSION,
+                       'nodes': self.nodes,
+                       'reverse': self.reverse},
+                      graph_file, sort_keys=True, separators=(',', ':'))
+        os.replace(tmp_path, path)
+        self.changed = False
+
+    def _build_reverse(self):
+        reverse = {}
+        for number in sorted(self.nodes):
+            node = self.nodes[number]
+            for kind in edge_kinds:
+                for target in node.get(kind, ()):
+                    reverse.setdefault(target, {}).setdefault(
+                        kind, []).append(number)
+        self.reverse = reverse
+
+    def update(self, number, path, text):
+        """Add or refresh the node of PEP `number` from its source `text`.
+
+        Nothing is rescanned if the source is unchanged.  Call `finish()`
+        once all PEPs have been added.
+        """
+        digest = hashlib.sha1(text.encode('utf-8')).hexdigest()
+        node = self.nodes.get(number)
+        if node is not None and node['digest'] == digest:
+            node['seen'] = True
+            return
+        node = extract_edges(number, text)
+        node.update(path=path, digest=digest, seen=True)
+        self.nodes[number] = node
+        self.changed = True
+
+    def finish(self):
+        """Drop the PEPs not updated since `load()` and rebuild reverse edges.
+        """
+        for number in list(self.nodes):
+            if not self.nodes[number].pop('seen', False):
+                del self.nodes[number]
+                self.changed = True
+        if self.changed:
+            self._build_reverse()
+
+    def exists(self, number):
+        # PEP 0 is generated from the others and never has a node.
+        return number in self.nodes or number == 0
+
+    def references(self, number, kind):
+        """Return the PEPs PEP `number` references through `kind` edges."""
+        return self.nodes.get(number, {}).get(kind, [])
+
+    def referenced_by(self, number, kind=None):
+        """Return the PEPs referencing PEP `number`.
+
+        With `kind`, only follow edges of that kind.
+        """
+        sources = self.reverse.get(number, {})
+        if kind is not None:
+            return sources.get(kind, [])
+        return sorted(set(source for kind_sources in sources.values()
+                          for source in kind_sources))
+
+    def superseded_by(self, number):
+        """Return the PEPs superseding PEP `number`.
+
+        Both "Superseded-By: B" in A and "Replaces: A" in B count.
+        """
+        targets = set(self.references(number, SUPERSEDED_BY))
+        targets.update(self.referenced_by(number, REPLACES))
+        return sorted(targets)
+
+    def superseded_chain(self, number):
+        """Return the PEPs `number` was successively superseded by.
+
+        The chain starts with `number` itself.  Where a PEP was superseded by
+        more than one PEP the lowest numbered one is followed.  The chain
+        stops short of a cycle.
+        """
+        chain = [number]
+        seen = set(chain)
+        while True:
+            successors = [successor for successor in self.superseded_by(number)
+                          if successor not in seen]
+            if not successors:
+                return chain
+            number = successors[0]
+            chain.append(number)
+            seen.add(number)
+
+    def dangling(self, kinds=edge_kinds):
+        """Return ``(source, kind, target)`` for edges to missing PEPs."""
+        edges = []
+        for target in sorted(self.reverse):
+            if self.exists(target):
+                continue
+            for kind in kinds:
+                for source in self.reverse[target].get(kind, ()):
+                    edges.append((source, kind, target))
+        edges.sort()
+        return edges
+
+    def cycles(self):
+        """Return the cycles of the Requires and supersession relations.
+
+        Each cycle is reported as ``(relation, [pep numbers])``, relation
+        being 'requires' or 'supersedes'; the numbers are the strongly
+        connected component the cycle is in.
+        """
+        relations = (
+            (REQUIRES, lambda number: self.references(number, REQUIRES)),
+            ('supersedes', self.superseded_by),
+        )
+        found = []
+        for relation, successors in relations:
+            for component in _strongly_connected(sorted(self.nodes),
+                                                 successors):
+                if len(component) > 1 or \
+                        component[0] in successors(component[0]):
+                    found.append((relation, sorted(component)))
+        return found
+
+
+def _strongly_connected(numbers, successors):
+    """Tarjan's algorithm, iteratively to cope with long chains."""
+    index = {}
+    lowlink = {}
+    stack = []
+    on_stack = set()
+    components = []
+    counter = 0
+    for root in numbers:
+        if root in index:
+            continue
+        work = [(root, iter(successors(root)))]
+        index[root] = lowlink[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack.add(root)
+        while work:
+            number, children = work[-1]
+            for child in children:
+                if child not in index:
+                    index[child] = lowlink[child] = counter
+                    counter += 1
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(successors(child))))
+                    break
+                elif child in on_stack:
+                    lowlink[number] = min(lowlink[number], index[child])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[number])
+                if lowlink[number] == index[number]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == number:
+                            break
+                    components.append(component)
+    return components
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        prog='genpepindex.py --graph',
+        description="Report cycles and references to missing PEPs in the "
+                    "cross-reference graph written by genpepindex.py.")
+    parser.add_argument('graph', nargs='?', default=GRAPH_NAME,
+                        help="graph file (default: %(default)s)")
+    parser.add_argument('--headers-only', action='store_true',
+                        help="ignore PEPs mentioned in the body text")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.graph):
+        parser.error("no graph at %s, run genpepindex.py first" %
+                     (args.graph,))
+    graph = PEPGraph.load(args.graph)
+    kinds = edge_kinds[:-1] if args.headers_only else edge_kinds
+    problems = 0
+    for relation, component in graph.cycles():
+        print("cycle in %s among PEPs %s" %
+              (relation, ', '.join(map(str, component))))
+        problems += 1
+    for source, kind, target in graph.dangling(kinds):
+        print("PEP %d: %s missing PEP %d" % (source, kind, target))
+        problems += 1
+    return 1 if problems else 0
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 """Code for handling object representation of a PEP."""
 from __future__ import absolute_import
+import os
 import re
 import sys
 import textwrap
@@ -31,6 +32,61 @@ class PEPParseError(PEPError):
     pass
 
 
+def find_pep_files(path):
+    """Return the sorted paths of the PEP source files in directory `path`.
+
+    PEP 0 is skipped as it is generated from the other PEPs.
+    """
+    pep_files = []
+    for file_path in os.listdir(path):
+        if file_path.startswith('pep-0000.'):
+            continue
+        if not (file_path.startswith("pep-") and
+                file_path.endswith((".txt", ".rst"))):
+            continue
+        abs_file_path = os.path.join(path, file_path)
+        if os.path.isfile(abs_file_path):
+            pep_files.append(abs_file_path)
+    pep_files.sort()
+    return pep_files
+
+
+def parse_authors(data):
+    """Return the (name, email) pairs listed in an Author header.
+
+    Names lacking an email address come with an empty one.
+    """
+    # XXX Consider using email.utils.parseaddr (doesn't work with names
+    # lacking an email address.
+    angled = constants.text_type(r'(?P<author>.+?) <(?P<email>.+?)>')
+    paren = constants.text_type(r'(?P<email>.+?) \((?P<author>.+?)\)')
+    simple = constants.text_type(r'(?P<author>[^,]+)')
+    author_list = []
+    for regex in (angled, paren, simple):
+        # Watch out for commas separating multiple names.
+        regex += u'(,\s*)?'
+        for match in re.finditer(regex, data):
+            # Watch out for suffixes like 'Jr.' when they are comma-separated
+            # from the name and thus cause issues when *all* names are only
+            # separated by commas.
+            match_dict = match.groupdict()
+            author = match_dict['author']
+            if not author.partition(' ')[1] and author.endswith('.'):
+                prev_author = author_list.pop()
+                author = ', '.join([prev_author, author])
+            if u'email' not in match_dict:
+                email = ''
+            else:
+                email = match_dict['email']
+            author_list.append((author, email))
+        else:
+            # If authors were found then stop searching as only expect one
+            # style of author citation.
+            if author_list:
+                break
+    return author_list
+
+
 class Author(object):
 
     """Represent PEP authors.
@@ -240,44 +296,12 @@ class PEP(object):
                            self.number)
         self.status = status
         # 'Author'.
-        authors_and_emails = self._parse_author(metadata['Author'])
+        authors_and_emails = parse_authors(metadata['Author'])
         if len(authors_and_emails) < 1:
             raise PEPError("no authors found", pep_file.name,
                            self.number)
         self.authors = list(map(Author, authors_and_emails))
 
-    def _parse_author(self, data):
-        """Return a list of author names and emails."""
-        # XXX Consider using email.utils.parseaddr (doesn't work with names
-        # lacking an email address.
-        angled = constants.text_type(r'(?P<author>.+?) <(?P<email>.+?)>')
-        paren = constants.text_type(r'(?P<email>.+?) \((?P<author>.+?)\)')
-        simple = constants.text_type(r'(?P<author>[^,]+)')
-        author_list = []
-        for regex in (angled, paren, simple):
-            # Watch out for commas separating multiple names.
-            regex += u'(,\s*)?'
-            for match in re.finditer(regex, data):
-                # Watch out for suffixes like 'Jr.' when they are comma-separated
-                # from the name and thus cause issues when *all* names are only
-                # separated by commas.
-                match_dict = match.groupdict()
-                author = match_dict['author']
-                if not author.partition(' ')[1] and author.endswith('.'):
-                    prev_author = author_list.pop()
-                    author = ', '.join([prev_author, author])
-                if u'email' not in match_dict:
-                    email = ''
-                else:
-                    email = match_dict['email']
-                author_list.append((author, email))
-            else:
-                # If authors were found then stop searching as only expect one
-                # style of author citation.
-                if author_list:
-                    break
-        return author_list
-
     @property
     def type_abbr(self):
         """Return the how the type is to be represented in the index."""
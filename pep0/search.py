@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+"""Full-text search over PEP bodies.
+
+The index is a single file holding an inverted index of every PEP body:
+
+    + an 8 byte magic number and the length of the metadata block,
+    + the metadata block (JSON) with the table of indexed PEPs and the
+      lexicon, which maps each term to its slice of the postings array,
+    + the postings array, little-endian unsigned 32-bit integers.
+
+The postings list of a term is a run of ``doc, tf, pos_1 ... pos_tf``
+records, sorted by document.  Positions count words from the start of the
+PEP body, which is what phrase queries are matched against.  The postings
+array is memory-mapped when the index is opened, so a query only touches
+the pages of the terms it asks for.
+
+Rebuilding the index reuses the postings of every PEP whose source is
+unchanged, so only new or edited PEPs are parsed and tokenized again.
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+import array
+import hashlib
+import io
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import sys
+
+from collections import namedtuple
+
+from .pep import PEP, PEPError, find_pep_files
+
+
+INDEX_NAME = 'pep-search.idx'
+
+_MAGIC = b'PEPSIDX1'
+_PREAMBLE = struct.Struct('<8sQ')
+_POSTING_SIZE = 4
+
+# BM25 parameters.
+K1 = 1.2
+B = 0.75
+
+_word_re = re.compile(r'\w+', re.UNICODE)
+_query_re = re.compile(r'"([^"]*)"|(\S+)', re.UNICODE)
+
+
+def tokenize(text):
+    """Return the list of lowercased words in `text`."""
+    return _word_re.findall(text.lower())
+
+
+Document = namedtuple('Document',
+                      'number path digest length title status type_')
+
+SearchResult = namedtuple('SearchResult', 'score document')
+
+
+def _read_pep(path):
+    """Return the digest, header metadata and body of the PEP at `path`."""
+    with open(path, 'rb') as pep_file:
+        data = pep_file.read()
+    digest = hashlib.sha1(data).hexdigest()
+    text = io.StringIO(data.decode('utf-8'), newline=None)
+    text.name = path
+    pep = PEP(text)
+    text.seek(0)
+    body = text.read().partition(u'\n\n')[2]
+    return digest, pep, body
+
+
+def _term_positions(words):
+    positions = {}
+    for position, word in enumerate(words):
+        positions.setdefault(word, []).append(position)
+    return positions
+
+
+class SearchIndex(object):
+
+    """Read-only view of an on-disk search index.
+
+    Attributes:
+
+        + documents : Sequence(Document)
+            The indexed PEPs, in PEP number order.
+
+        + terms : dict
+            Maps each term to ``(offset, size, df)``, the slice of the
+            postings array holding its postings and its document frequency.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped.
+            self._file.close()
+            raise ValueError('%s is not a PEP search index' % (path,))
+        magic, meta_size = _PREAMBLE.unpack_from(self._map)
+        if magic != _MAGIC:
+            self.close()
+            raise ValueError('%s is not a PEP search index' % (path,))
+        meta_end = _PREAMBLE.size + meta_size
+        meta = json.loads(self._map[_PREAMBLE.size:meta_end].decode('utf-8'))
+        self.documents = [Document(*doc) for doc in meta['documents']]
+        self.terms = meta['terms']
+        self.average_length = meta['average_length']
+        start = meta_end + (-meta_end % _POSTING_SIZE)
+        view = memoryview(self._map)[start:]
+        if sys.byteorder == 'little':
+            self._postings = view.cast('I')
+        else:
+            self._postings = array.array('I', view.tobytes())
+            self._postings.byteswap()
+            view.release()
+
+    def close(self):
+        if isinstance(self._postings, memoryview):
+            self._postings.release()
+        self._postings = None
+        try:
+            self._map.close()
+        except BufferError:
+            # Position views handed out by postings() are still alive; the
+            # map goes away together with the last of them.
+            pass
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def postings(self, term):
+        """Yield ``(doc, positions)`` for each PEP containing `term`.
+
+        `doc` indexes into `documents`.
+        """
+        try:
+            offset, size, _ = self.terms[term]
+        except KeyError:
+            return
+        postings = self._postings[offset:offset + size]
+        index = 0
+        while index < size:
+            doc, tf = postings[index], postings[index + 1]
+            index += 2
+            yield doc, postings[index:index + tf]
+            index += tf
+
+    def _phrase_postings(self, words):
+        """Return ``{doc: tf}`` for the documents containing phrase `words`."""
+        candidates = None
+        for offset, word in enumerate(words):
+            found = {}
+            for doc, positions in self.postings(word):
+                if candidates is None:
+                    found[doc] = set(positions)
+                elif doc in candidates:
+                    starts = candidates[doc].intersection(
+                        pos - offset for pos in positions)
+                    if starts:
+                        found[doc] = starts
+            candidates = found
+            if not candidates:
+                break
+        return dict((doc, len(starts))
+                    for doc, starts in (candidates or {}).items())
+
+    def _bm25(self, tf, df, length):
+        num_docs = len(self.documents)
+        idf = math.log(1.0 + (num_docs - df + 0.5) / (df + 0.5))
+        norm = 1.0 - B + B * length / (self.average_length or 1.0)
+        return idf * tf * (K1 + 1.0) / (tf + K1 * norm)
+
+    def search(self, query, limit=10):
+        """Return the best `limit` matches for `query`, best first.
+
+        Words are scored with BM25 and any one of them is enough to match.
+        Double-quoted phrases are scored the same way, but every phrase has
+        to appear in a PEP for it to match.
+        """
+        scores = {}
+        required = None
+        for match in _query_re.finditer(query):
+            phrase, word = match.groups()
+            words = tokenize(phrase if phrase is not None else word)
+            if not words:
+                continue
+            if phrase is not None and len(words) > 1:
+                tfs = self._phrase_postings(words)
+                if required is None:
+                    required = set(tfs)
+                else:
+                    required.intersection_update(tfs)
+            else:
+                tfs = {}
+                for term in words:
+                    for doc, positions in self.postings(term):
+                        tfs[doc] = tfs.get(doc, 0) + len(positions)
+            for doc, tf in tfs.items():
+                scores[doc] = scores.get(doc, 0.0) + self._bm25(
+                    tf, len(tfs), self.documents[doc].length)
+        if required is not None:
+            scores = dict((doc, score) for doc, score in scores.items()
+                          if doc in required)
+        ranked = sorted(scores.items(),
+                        key=lambda item: (-item[1],
+                                          self.documents[item[0]].number))
+        return [SearchResult(score, self.documents[doc])
+                for doc, score in ranked[:limit]]
+
+
+def _write_index(index_path, documents, postings_by_term):
+    postings = array.array('I')
+    terms = {}
+    for term in sorted(postings_by_term):
+        doc_postings = postings_by_term[term]
+        doc_postings.sort()
+        offset = len(postings)
+        for doc, positions in doc_postings:
+            postings.append(doc)
+            postings.append(len(positions))
+            postings.extend(positions)
+        terms[term] = (offset, len(postings) - offset, len(doc_postings))
+    if documents:
+        average_length = (sum(doc.length for doc in documents) /
+                          float(len(documents)))
+    else:
+        average_length = 0.0
+    meta = json.dumps({'documents': [list(doc) for doc in documents],
+                       'terms': terms,
+                       'average_length': average_length},
+                      separators=(',', ':')).encode('utf-8')
+    if sys.byteorder != 'little':
+        postings.byteswap()
+    tmp_path = index_path + '.tmp'
+    with open(tmp_path, 'wb') as index_file:
+        index_file.write(_PREAMBLE.pack(_MAGIC, len(meta)))
+        index_file.write(meta)
+        meta_end = _PREAMBLE.size + len(meta)
+        index_file.write(b'\0' * (-meta_end % _POSTING_SIZE))
+        postings.tofile(index_file)
+    os.replace(tmp_path, index_path)
+
+
+def build_index(path, index_path=None, verbose=False):
+    """Create or update the search index for the PEPs in directory `path`.
+
+    PEPs whose source is unchanged since the last build keep their postings;
+    only the others are parsed and tokenized, and the index file is left
+    alone if nothing changed.  Return the number of PEPs (re)indexed.
+    """
+    if index_path is None:
+        index_path = os.path.join(path, INDEX_NAME)
+    try:
+        old_index = SearchIndex(index_path)
+    except (IOError, OSError, ValueError):
+        old_index = None
+    old_docs = {}
+    if old_index is not None:
+        for doc_id, doc in enumerate(old_index.documents):
+            old_docs[os.path.basename(doc.path)] = doc_id, doc
+
+    documents = []
+    reused = {}  # old doc id -> new doc id
+    fresh = []   # (new doc id, term positions)
+    for pep_path in find_pep_files(path):
+        with open(pep_path, 'rb') as pep_file:
+            digest = hashlib.sha1(pep_file.read()).hexdigest()
+        old_doc_id, old_doc = old_docs.get(os.path.basename(pep_path),
+                                           (None, None))
+        if old_doc is not None and old_doc.digest == digest:
+            reused[old_doc_id] = len(documents)
+            documents.append(old_doc._replace(path=pep_path))
+            continue
+        try:
+            digest, pep, body = _read_pep(pep_path)
+        except PEPError as e:
+            print("Error processing PEP %s (%s), excluding:" %
+                  (e.number, e.filename), e, file=sys.stderr)
+            continue
+        words = tokenize(body)
+        if verbose:
+            print("indexing", pep_path)
+        fresh.append((len(documents), _term_positions(words)))
+        documents.append(Document(pep.number, pep_path, digest, len(words),
+                                  pep.title, pep.status, pep.type_))
+
+    if old_index is not None:
+        if not fresh and len(reused) == len(old_index.documents) == \
+                len(documents):
+            old_index.close()
+            return 0
+        postings_by_term = {}
+        if reused:
+            for term in old_index.terms:
+                for doc, positions in old_index.postings(term):
+                    if doc in reused:
+                        postings_by_term.setdefault(term, []).append(
+                            (reused[doc], positions.tolist()))
+        old_index.close()
+    else:
+        postings_by_term = {}
+    for doc_id, term_positions in fresh:
+        for term, positions in term_positions.items():
+            postings_by_term.setdefault(term, []).append((doc_id, positions))
+
+    _write_index(index_path, documents, postings_by_term)
+    return len(fresh)
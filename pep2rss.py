@@ -2,73 +2,320 @@
 
 # usage: pep-hook.py $REPOS $REV
 # (standard post-commit args)
+#
+# Writes every feed in FEEDS (with --feeds all, GROUPED_FEEDS as well; or
+# those in the JSON file given with --feeds) to $REPOS from a single scan
+# of the PEP headers, as RSS and, next to it with an .atom extension, as
+# Atom.  A feed is only rewritten when the
+# items it lists changed since the last run.
 
 import os, glob, time, datetime, stat, re, sys
+import argparse
+import functools
+import hashlib
+import heapq
+import json
+import unicodedata
+from collections import namedtuple
 import PyRSS2Gen as rssgen
+from pep0.pep import Author, parse_authors
 
-RSS_PATH = os.path.join(sys.argv[1], 'peps.rss')
+# where the feeds are published
+FEED_BASE_URL = 'http://www.python.org/dev/peps/'
 
-def firstline_startingwith(full_path, text):
-    for line in open(full_path, encoding="utf-8"):
-        if line.startswith(text):
-            return line[len(text):].strip()
-    return None
+# number of PEPs in a feed
+NUM_ITEMS = 10
 
-# get list of peps with creation time
-# (from "Created:" string in pep .rst or .txt)
-peps = glob.glob('pep-*.txt')
-peps.extend(glob.glob('pep-*.rst'))
-def pep_creation_dt(full_path):
-    created_str = firstline_startingwith(full_path, 'Created:')
+# remembers what each feed listed when it was last written
+CACHE_NAME = '.pep2rss-cache.json'
+
+# serialized items, shared by all feeds and kept between runs
+FRAGMENTS_NAME = '.pep2rss-fragments.json'
+MAX_FRAGMENTS = 4096
+
+def pep_headers(full_path):
+    """Return {name: value} for the header block at the top of a PEP.
+
+    Continuation lines are kept, separated by newlines.  Nothing past
+    the headers is read.
+    """
+    headers = {}
+    name = None
+    with open(full_path, encoding="utf-8") as pep_file:
+        for line in pep_file:
+            if not line.strip():
+                break
+            if line[0].isspace() and name is not None:
+                headers[name] += '\n' + line.strip()
+                continue
+            name, sep, value = line.partition(':')
+            if not sep or name in headers:
+                name = None
+                continue
+            headers[name] = value.strip()
+    return headers
+
+def first_line(value):
+    if value is None:
+        return None
+    return value.partition('\n')[0]
+
+# "return None" would make the most sense for PEPs without a usable date
+# but datetime objects refuse to compare with that. :-|
+EPOCH = datetime.datetime(*time.localtime(0)[:6])
+
+@functools.lru_cache(maxsize=None)
+def parse_created(created_str):
+    """Turn the value of a Created: header into a datetime."""
     # bleh, I was hoping to avoid re but some PEPs editorialize
     # on the Created line
-    m = re.search(r'''(\d+-\w+-\d{4})''', created_str)
+    m = re.search(r'''(\d+-\w+-\d{4})''', first_line(created_str) or '')
     if not m:
         # some older ones have an empty line, that's okay, if it's old
         # we ipso facto don't care about it.
-        # "return None" would make the most sense but datetime objects
-        # refuse to compare with that. :-|
-        return datetime.datetime(*time.localtime(0)[:6])
+        return EPOCH
     created_str = m.group(1)
     try:
         t = time.strptime(created_str, '%d-%b-%Y')
     except ValueError:
         t = time.strptime(created_str, '%d-%B-%Y')
     return datetime.datetime(*t[:6])
-peps_with_dt = [(pep_creation_dt(full_path), full_path) for full_path in peps]
-# sort peps by date, newest first
-peps_with_dt.sort(reverse=True)
 
-# generate rss items for 10 most recent peps
-items = []
-for dt, full_path in peps_with_dt[:10]:
-    try:
-        n = int(full_path.split('-')[-1].split('.')[0])
-    except ValueError:
-        pass
-    title = firstline_startingwith(full_path, 'Title:')
-    author = firstline_startingwith(full_path, 'Author:')
-    url = 'http://www.python.org/dev/peps/pep-%0.4d' % n
-    item = rssgen.RSSItem(
-        title = 'PEP %d: %s' % (n, title),
-        link = url,
-        description = 'Author: %s' % author,
-        guid = rssgen.Guid(url),
-        pubDate = dt)
-    items.append(item)
+def pep_number(full_path):
+    return int(full_path.split('-')[-1].split('.')[0])
 
-# the rss envelope
-desc = """
+def pep_authors(value):
+    """Return an Author for each author listed in an Author: header."""
+    value = (value or '').replace('\n', ' ')
+    return [Author(author_and_email)
+            for author_and_email in parse_authors(value)]
+
+def author_names(value):
+    """Return the author names listed in an Author: header."""
+    names = []
+    for author in pep_authors(value):
+        if author.first_last not in names:
+            names.append(author.first_last)
+    return names
+
+def first_author(value):
+    """Return the first author in an Author: header, as RSS has it.
+
+    RSS wants "addr (Name)"; None if the author has no address.
+    """
+    authors = pep_authors(value)
+    if not authors or not authors[0].email:
+        return None
+    return '%s (%s)' % (authors[0].email, authors[0].first_last)
+
+PEPInfo = namedtuple('PEPInfo', 'path created modified headers')
+
+def scan_peps(paths):
+    """Yield a PEPInfo for each PEP in `paths`.
+
+    Each file is opened once and only its headers are read.
+    """
+    for full_path in paths:
+        headers = pep_headers(full_path)
+        modified = datetime.datetime.fromtimestamp(
+            os.stat(full_path)[stat.ST_MTIME])
+        yield PEPInfo(full_path, parse_created(headers.get('Created')),
+                      modified, headers)
+
+# A feed lists the `num_items` PEPs with the latest `sort_by` date
+# ('created' or 'modified').  With `group_by` ('status', 'type' or
+# 'author') one feed is written for each distinct value; '{group}' and
+# '{slug}' in `filename`, `title` and `description` are replaced by the
+# value and by its file name friendly form.
+FeedSpec = namedtuple('FeedSpec',
+                      'filename title description sort_by group_by num_items')
+FeedSpec.__new__.__defaults__ = ('created', None, NUM_ITEMS)
+
+DESCRIPTION = """
 Newest Python Enhancement Proposals (PEPs) - Information on new
 language features, and some meta-information like release
 procedure and schedules
 """.strip()
-rss = rssgen.RSS2(
-    title = 'Newest Python PEPs',
-    link = 'http://www.python.org/dev/peps',
-    description = desc,
-    lastBuildDate = datetime.datetime.now(),
-    items = items)
-
-with open(RSS_PATH, 'w', encoding="utf-8") as fp:
-    fp.write(rss.to_xml(encoding="utf-8"))
+
+# written by default
+FEEDS = [
+    FeedSpec('peps.rss', 'Newest Python PEPs', DESCRIPTION),
+]
+
+# the grouped feeds add one file per status, type and author; they are
+# written along with FEEDS with "--feeds all"
+GROUPED_FEEDS = [
+    FeedSpec('peps-status-{slug}.rss', 'Newest {group} Python PEPs',
+             'Newest Python Enhancement Proposals (PEPs) with status '
+             '{group}', group_by='status'),
+    FeedSpec('peps-type-{slug}.rss', 'Newest {group} Python PEPs',
+             'Newest {group} Python Enhancement Proposals (PEPs)',
+             group_by='type'),
+    FeedSpec('peps-author-{slug}.rss', 'Newest Python PEPs by {group}',
+             'Newest Python Enhancement Proposals (PEPs) by {group}',
+             group_by='author'),
+    FeedSpec('peps-modified.rss', 'Recently modified Python PEPs',
+             'Python Enhancement Proposals (PEPs), most recently '
+             'modified first', sort_by='modified'),
+]
+
+def load_feeds(config_path):
+    """Read a list of FeedSpec fields (as JSON objects) from a file."""
+    with open(config_path, encoding="utf-8") as config_file:
+        return [FeedSpec(**spec) for spec in json.load(config_file)]
+
+def feed_groups(spec, pep):
+    if spec.group_by is None:
+        return [None]
+    if spec.group_by == 'author':
+        return author_names(pep.headers.get('Author'))
+    value = pep.headers.get(spec.group_by.capitalize())
+    return [first_line(value)] if value else []
+
+def select_items(feeds, peps):
+    """Return {(feed index, group): [(date, PEPInfo), ...]}, newest first.
+
+    All feeds are filled during one pass over `peps`, keeping only the
+    best `num_items` entries of each.
+    """
+    heaps = {}
+    for pep in peps:
+        for index, spec in enumerate(feeds):
+            dt = pep.modified if spec.sort_by == 'modified' else pep.created
+            entry = (dt, pep.path, pep)
+            for group in feed_groups(spec, pep):
+                heap = heaps.setdefault((index, group), [])
+                if len(heap) < spec.num_items:
+                    heapq.heappush(heap, entry)
+                elif entry[:2] > heap[0][:2]:
+                    heapq.heapreplace(heap, entry)
+    return dict((key, [(dt, pep) for dt, _, pep in
+                       sorted(heap, key=lambda entry: entry[:2],
+                              reverse=True)])
+                for key, heap in heaps.items())
+
+def make_item(dt, full_path, headers):
+    n = pep_number(full_path)
+    url = 'http://www.python.org/dev/peps/pep-%0.4d' % n
+    return rssgen.RSSItem(
+        title = 'PEP %d: %s' % (n, first_line(headers.get('Title'))),
+        link = url,
+        description = 'Author: %s' % first_line(headers.get('Author')),
+        author = first_author(headers.get('Author')),
+        guid = rssgen.Guid(url),
+        pubDate = dt)
+
+def items_digest(spec, group, items):
+    """Hash everything a feed's rendering depends on except the build date."""
+    fields = [spec.title, spec.description, group]
+    for item in items:
+        fields.append([item.title, item.link, item.description, item.author,
+                       item.pubDate.isoformat()])
+    return hashlib.sha1(json.dumps(fields).encode('utf-8')).hexdigest()
+
+def slugify(value):
+    value = unicodedata.normalize('NFKD', value).encode('ascii', 'ignore')
+    return re.sub(r'[^a-z0-9]+', '-',
+                  value.decode('ascii').lower()).strip('-') or 'unknown'
+
+def grouped_filename_re(spec):
+    """Match the file names of the feeds of a grouped FeedSpec."""
+    parts = re.split(r'\{(?:group|slug)\}', spec.filename)
+    return re.compile('.+'.join(map(re.escape, parts)) + '$')
+
+def load_cache(cache_path):
+    try:
+        with open(cache_path, encoding="utf-8") as cache_file:
+            return json.load(cache_file)
+    except (OSError, ValueError):
+        return {}
+
+def write_feeds(feeds, paths, out_dir):
+    """Write all `feeds` for the PEPs in `paths` to `out_dir`.
+
+    Return the names of the RSS feed files that were (re)written, the
+    Atom version of each being written along with it, and of those that
+    were removed: the feeds written last time for groups no PEP is in
+    any more.
+    """
+    cache_path = os.path.join(out_dir, CACHE_NAME)
+    cache = load_cache(cache_path)
+    fragment_cache = rssgen.FragmentCache(
+        os.path.join(out_dir, FRAGMENTS_NAME), MAX_FRAGMENTS)
+    new_cache = {}
+    written = []
+    selected = select_items(feeds, scan_peps(paths))
+    for (index, group), entries in sorted(selected.items(),
+                                          key=lambda item: (item[0][0],
+                                                            item[0][1] or '')):
+        spec = feeds[index]
+        fmt = {'group': group, 'slug': slugify(group or '')}
+        filename = spec.filename.format(**fmt)
+        items = [make_item(dt, pep.path, pep.headers)
+                 for dt, pep in entries]
+        digest = items_digest(spec, group, items)
+        new_cache[filename] = digest
+        rss_path = os.path.join(out_dir, filename)
+        atom_path = os.path.splitext(rss_path)[0] + '.atom'
+        if cache.get(filename) == digest and os.path.exists(rss_path) \
+                and os.path.exists(atom_path):
+            continue
+
+        # the rss envelope
+        rss = rssgen.RSS2(
+            title = spec.title.format(**fmt),
+            link = 'http://www.python.org/dev/peps',
+            description = spec.description.format(**fmt),
+            lastBuildDate = datetime.datetime.now(datetime.timezone.utc),
+            items = items,
+            feed_url = FEED_BASE_URL + os.path.basename(atom_path),
+            fragment_cache = fragment_cache)
+
+        with open(rss_path, 'wb') as rss_fp, open(atom_path, 'wb') as atom_fp:
+            rss.stream_rss_and_atom(rss_fp, atom_fp, encoding="utf-8")
+        written.append(filename)
+
+    removed = []
+    patterns = [grouped_filename_re(spec) for spec in feeds if spec.group_by]
+    for filename in sorted(set(cache) - set(new_cache)):
+        if not any(pattern.match(filename) for pattern in patterns):
+            continue
+        rss_path = os.path.join(out_dir, filename)
+        for path in (rss_path, os.path.splitext(rss_path)[0] + '.atom'):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        removed.append(filename)
+
+    fragment_cache.save()
+    if new_cache != cache:
+        with open(cache_path, 'w', encoding="utf-8") as cache_file:
+            json.dump(new_cache, cache_file, sort_keys=True, indent=0)
+    return written, removed
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description="Write the PEP RSS feeds.")
+    parser.add_argument('out_dir', help="directory the feeds are written to")
+    parser.add_argument('rev', nargs='?', help=argparse.SUPPRESS)
+    parser.add_argument('--feeds', metavar='FILE',
+                        help="JSON list of feed definitions to use instead "
+                             "of peps.rss alone, or 'all' for the built-in "
+                             "feeds grouped by status, type and author too")
+    args = parser.parse_args(argv[1:])
+    if args.feeds == 'all':
+        feeds = FEEDS + GROUPED_FEEDS
+    elif args.feeds:
+        feeds = load_feeds(args.feeds)
+    else:
+        feeds = FEEDS
+
+    # get list of peps with their headers
+    # (from the header block of each pep .rst or .txt)
+    peps = glob.glob('pep-*.txt')
+    peps.extend(glob.glob('pep-*.rst'))
+    write_feeds(feeds, peps, args.out_dir)
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+"""Search the text of the PEPs.
+
+Usage:
+
+    pepsearch.py --build [path]
+        Create or update the search index for the PEPs in `path`.
+
+    pepsearch.py [-n N] [--index FILE] query ...
+        Print the PEPs best matching the query.  Put phrases in double
+        quotes: pepsearch.py '"context variable"' asyncio
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+
+from pep0.search import INDEX_NAME, SearchIndex, build_index
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Full-text search of the PEPs.")
+    parser.add_argument('--build', metavar='PATH', nargs='?', const='.',
+                        help="create or update the index for the PEPs in "
+                             "PATH (default: current directory)")
+    parser.add_argument('--index', metavar='FILE',
+                        help="index file (default: %s in the PEP directory)"
+                             % INDEX_NAME)
+    parser.add_argument('-n', '--limit', type=int, default=10,
+                        help="number of results to show (default: 10)")
+    parser.add_argument('-v', '--verbose', action='store_true')
+    parser.add_argument('query', nargs='*')
+    args = parser.parse_args(argv)
+
+    if args.build is not None:
+        count = build_index(args.build, args.index, verbose=args.verbose)
+        if args.verbose:
+            print("%d PEPs (re)indexed" % (count,))
+        if not args.query:
+            return 0
+    elif not args.query:
+        parser.error("no query given")
+
+    index_path = args.index or os.path.join(args.build or '.', INDEX_NAME)
+    if not os.path.exists(index_path):
+        print("Error: no search index at %s, build it with --build" %
+              (index_path,), file=sys.stderr)
+        return 1
+    with SearchIndex(index_path) as index:
+        for result in index.search(' '.join(args.query), args.limit):
+            doc = result.document
+            print("PEP %4d  %6.2f  %-15s %-11s %s" %
+                  (doc.number, result.score, doc.type_, doc.status,
+                   doc.title))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,13 +3,30 @@
 # https://gist.github.com/njsmith/9157645
 
 # usage:
-#   python3 scan-ops.py stdlib_path sklearn_path nipy_path
+#   python3 scan-ops.py [-j N] [--cache FILE] [--fast] [--format FORMAT] \
+#       stdlib_path sklearn_path nipy_path
+#   python3 scan-ops.py [options] [--config FILE] [--dot NAME=N1,N2] \
+#       [NAME=]path ...
+#   python3 scan-ops.py --check-lexer [path ...]
 
 import sys
 import os
 import os.path
+import argparse
+import codecs
+import csv
+import hashlib
+import itertools
+import json
+import re
 import tokenize
 from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 NON_SOURCE_TOKENS = [
     tokenize.COMMENT, tokenize.NL, tokenize.ENCODING, tokenize.NEWLINE,
@@ -18,6 +35,205 @@ NON_SOURCE_TOKENS = [
 
 SKIP_OPS = list("(),.:[]{}@;") + ["->", "..."]
 
+# number of files handed to a worker process at a time
+CHUNK_SIZE = 64
+
+CACHE_NAME = ".scan-ops-cache.json"
+
+# Since Python 3.12 tokenize is the C tokenizer: f-strings are split into
+# tokens (PEP 701), with the operators of their replacement fields counted
+# as such, and "<>" and stray characters like "$" or "?" are OP tokens too.
+_C_TOKENIZE = sys.version_info >= (3, 12)
+_EXTRA_OPS = ["<>"] if _C_TOKENIZE else []
+
+# The fast lexer: one pattern that skips whitespace, comments and line
+# continuations, then matches a single token.  Only operators, names and
+# the lines tokens start on matter, so strings and numbers are matched as
+# a whole and otherwise ignored.  Numbers and operators use the same
+# definitions as tokenize.  Since Python 3.12 only the start of an
+# f-string is matched, the lexer then follows its text and replacement
+# fields.
+_STRING_PREFIX = br"(?:[bBrRuUfF]|[bB][rR]|[rR][bB]|[fF][rR]|[rR][fF])?"
+_FSTRING_START = (br"""
+        (?P<fstring> (?:[fF][rR]?|[rR][fF]) (?:'''|\"\"\"|'|\"))
+      |""" if _C_TOKENIZE else b"")
+_FAST_TOKEN_RE = re.compile(br"""
+    (?:[ \t\f\r\n]+ | \#[^\r\n]* | \\\r?\n(?!\Z))*
+    (?:""" + _FSTRING_START + br"""
+        (?P<string> """ + _STRING_PREFIX + br"""
+            (?: '''[^'\\]*(?:(?:\\.|'(?!''))[^'\\]*)*'''
+              | \"\"\"[^"\\]*(?:(?:\\.|"(?!""))[^"\\]*)*\"\"\" ))
+      | (?P<unterminated> """ + _STRING_PREFIX + br""" (?:'''|\"\"\"))
+      | (?P<short_string> """ + _STRING_PREFIX + br"""
+            (?: '[^\n'\\]*(?:\\(?:\r\n|.)[^\n'\\]*)*'
+              | "[^\n"\\]*(?:\\(?:\r\n|.)[^\n"\\]*)*" ))
+      | (?P<number> """ + tokenize.Number.encode("ascii") + br""")
+      | (?P<name> [\w\x80-\xff]+)
+      | (?P<op> """ + b"|".join(
+          re.escape(op.encode("ascii"))
+          for op in sorted(list(tokenize.EXACT_TOKEN_TYPES) + _EXTRA_OPS,
+                           reverse=True)) + br""")
+      | (?P<continuation> \\\r?\n)
+      | (?P<end> \Z)
+      | (?P<error> .)
+    )""", re.VERBOSE | re.DOTALL)
+_OPENING = frozenset([b"(", b"[", b"{"])
+_CLOSING = frozenset([b")", b"]", b"}"])
+
+def _fstring_text_re(quote, raw):
+    """Match the text of an f-string with `quote` up to a brace or its end.
+
+    A backslash escapes anything but a brace, except \\N{...} which is
+    whole in non-raw f-strings.
+    """
+    q = re.escape(quote[:1])
+    if len(quote) == 3:
+        char = br"[^{}\\" + q + br"]|" + q + br"(?!" + q + q + br")"
+    else:
+        char = br"[^{}\\\n" + q + br"]"
+    escape = br"\\(?:[^{}]|(?=[{}]))"
+    if not raw:
+        escape = br"\\N\{[^}\n]*\}|" + escape
+    return re.compile(br"(?:" + char + br"|" + escape + br")*")
+
+_FSTRING_TEXT_RES = dict(((quote, raw), _fstring_text_re(quote, raw))
+                         for quote in (b"'", b'"', b"'''", b'"""')
+                         for raw in (False, True))
+
+# What the lexer is in, in an f-string: its text, a replacement field or
+# the format spec of one
+_TEXT, _FIELD, _SPEC = range(3)
+
+class _FStringError(Exception):
+    """An f-string the fast lexer doesn't follow."""
+
+def _lex_fast(data, dot_names, counts):
+    """Count the ops in the bytes `data` of a file into `counts` and
+    return its number of source lines, as tokenize has them."""
+    sloc_idxes = set()
+    line = 1
+    line_start = last = 0
+    depth = 0
+    # the f-strings and replacement fields being lexed, innermost last,
+    # as [state, quote, raw, bracket depth] lists
+    stack = []
+    pos = 3 if data.startswith(codecs.BOM_UTF8) else 0
+    match = _FAST_TOKEN_RE.match
+    view = memoryview(data)
+    while True:
+        frame = stack[-1] if stack else None
+        if frame is not None and frame[0] != _FIELD:
+            state, quote, raw, _ = frame
+            end = _FSTRING_TEXT_RES[quote, raw].match(data, pos).end()
+            # each piece of text is an FSTRING_MIDDLE token, and so is the
+            # text up to a doubled brace
+            doubled = state == _TEXT and data[end:end + 2] in (b"{{", b"}}")
+            marks = [pos] if end > pos or doubled else []
+            if doubled:
+                next_pos = end + 2
+            elif data.startswith(b"{", end) or \
+                    state == _SPEC and data.startswith(b"}", end):
+                next_pos = end + 1
+            elif state == _TEXT and data.startswith(quote, end):
+                next_pos = end + len(quote)
+            else:
+                raise _FStringError
+            if not doubled:
+                marks.append(end)
+                if end > pos and data[pos:end] in dot_names:
+                    counts["dot"] = counts.get("dot", 0) + 1
+            for mark in marks:
+                newlines = data.count(b"\n", last, mark)
+                if newlines:
+                    line += newlines
+                    line_start = data.rindex(b"\n", last, mark) + 1
+                last = mark
+                sloc_idxes.add(line)
+            pos = next_pos
+            if doubled:
+                continue
+            brace = data[end:end + 1]
+            if brace == b"{":
+                counts["{"] = counts.get("{", 0) + 1
+                depth += 1
+                stack.append([_FIELD, quote, raw, 0])
+            elif brace == b"}":
+                counts["}"] = counts.get("}", 0) + 1
+                depth -= 1
+                stack.pop()
+            else:
+                stack.pop()
+            continue
+
+        m = match(view, pos)
+        kind = m.lastgroup
+        if kind == "end":
+            if stack:
+                raise _FStringError
+            break
+        start = m.start(kind)
+        pos = m.end()
+        newlines = data.count(b"\n", last, start)
+        if newlines:
+            line += newlines
+            line_start = data.rindex(b"\n", last, start) + 1
+        last = start
+        sloc_idxes.add(line)
+        if kind == "op":
+            op = m.group(kind)
+            if frame is not None and frame[3] == 0:
+                # the end of a replacement field, or of its expression
+                if op == b"}":
+                    counts["}"] = counts.get("}", 0) + 1
+                    depth -= 1
+                    stack.pop()
+                    continue
+                if op == b":" or op == b":=":
+                    counts[":"] = counts.get(":", 0) + 1
+                    frame[0] = _SPEC
+                    pos = start + 1
+                    continue
+            string = op.decode("ascii")
+            counts[string] = counts.get(string, 0) + 1
+            if op in _OPENING:
+                depth += 1
+                if frame is not None:
+                    frame[3] += 1
+            elif op in _CLOSING:
+                depth -= 1
+                if frame is not None:
+                    frame[3] -= 1
+        elif kind == "name":
+            if m.group(kind) in dot_names:
+                counts["dot"] = counts.get("dot", 0) + 1
+        elif kind == "fstring":
+            prefix = m.group(kind)
+            quote = prefix.lstrip(b"fFrR")
+            stack.append([_TEXT, quote, b"r" in prefix.lower(), 0])
+        elif kind == "error" and _C_TOKENIZE:
+            string = m.group(kind).decode("latin-1")
+            if string in "'\"":
+                raise tokenize.TokenError("unterminated string literal",
+                                          (line, start - line_start))
+            counts[string] = counts.get(string, 0) + 1
+        elif stack and kind in ("unterminated", "continuation"):
+            raise _FStringError
+        elif kind == "unterminated":
+            raise tokenize.TokenError("EOF in multi-line string",
+                                      (line, start - line_start))
+        elif kind == "continuation":
+            # a backslash continuation at the very end of the file
+            depth = None
+    # tokenize ends with an ENDMARKER on the line after the last one
+    lines = data.count(b"\n")
+    if data and not data.endswith(b"\n"):
+        lines += 1
+    if depth != 0:
+        raise tokenize.TokenError("EOF in multi-line statement",
+                                  (lines + 1, 0))
+    sloc_idxes.add(lines + 1)
+    return len(sloc_idxes)
+
 class TokenCounts(object):
     def __init__(self, dot_names=[]):
         self.counts = {}
@@ -26,17 +242,48 @@ class TokenCounts(object):
 
     def count(self, path):
         sloc_idxes = set()
-        for token in tokenize.tokenize(open(path, "rb").readline):
-            if token.type == tokenize.OP:
-                self.counts.setdefault(token.string, 0)
-                self.counts[token.string] += 1
-            if token.string in self.dot_names:
-                self.counts.setdefault("dot", 0)
-                self.counts["dot"] += 1
-            if token.type not in NON_SOURCE_TOKENS:
-                sloc_idxes.add(token.start[0])
+        with open(path, "rb") as f:
+            for token in tokenize.tokenize(f.readline):
+                if token.type == tokenize.OP:
+                    self.counts.setdefault(token.string, 0)
+                    self.counts[token.string] += 1
+                if token.string in self.dot_names:
+                    self.counts.setdefault("dot", 0)
+                    self.counts["dot"] += 1
+                if token.type not in NON_SOURCE_TOKENS:
+                    sloc_idxes.add(token.start[0])
         self.sloc += len(sloc_idxes)
 
+    def count_fast(self, path):
+        """Same as count(), with a regular expression lexer.
+
+        The pattern runs over a memoryview of the file's bytes, which are
+        never decoded into a string.  Files that are not valid in their
+        declared encoding are handed to count(), so that they fail the
+        way they do there, and so are files with an f-string the lexer
+        doesn't follow (unterminated ones for instance).
+        """
+        with open(path, "rb") as f:
+            encoding, _ = tokenize.detect_encoding(f.readline)
+            f.seek(0)
+            data = f.read()
+        if not data.isascii():
+            try:
+                data.decode(encoding)
+            except UnicodeDecodeError:
+                return self.count(path)
+        dot_names = set(name.encode("ascii") for name in self.dot_names)
+        counts = {}
+        try:
+            self.sloc += _lex_fast(data, dot_names, counts)
+        except _FStringError:
+            counts = {}
+            return self.count(path)
+        finally:
+            # the counts made before a TokenError are kept, as in count()
+            for op, n in counts.items():
+                self.counts[op] = self.counts.get(op, 0) + n
+
     @classmethod
     def combine(cls, objs):
         combined = cls()
@@ -47,86 +294,438 @@ class TokenCounts(object):
             combined.sloc += obj.sloc
         return combined
 
-def count_tree(root, **kwargs):
-    c = TokenCounts(**kwargs)
+def source_files(root):
     for dirpath, _, filenames in os.walk(root):
         for filename in filenames:
             if filename.endswith(".py"):
-                path = os.path.join(dirpath, filename)
-                try:
-                    c.count(path)
-                    sys.stderr.write(".")
-                    sys.stderr.flush()
-                except Exception as e:
-                    sys.stderr.write("\nFailed to read %s: %s\n" % (path, e))
+                yield os.path.join(dirpath, filename)
+
+def count_file(path, dot_names=[], fast=False):
+    """Count one file, with the fast lexer if `fast` is true.
+
+    Returns its TokenCounts and None, or the error that stopped the file
+    from being read.  A file that fails part way through keeps the counts
+    made before the failure, as it does in a serial scan.
+    """
+    c = TokenCounts(dot_names=dot_names)
+    try:
+        if fast:
+            c.count_fast(path)
+        else:
+            c.count(path)
+    except Exception as e:
+        return c, str(e)
+    return c, None
+
+def _count_chunk(args):
+    paths, dot_names, fast = args
+    return [count_file(path, dot_names, fast) for path in paths]
+
+def _chunks(paths, size):
+    for start in range(0, len(paths), size):
+        yield paths[start:start + size]
+
+class FileCache(object):
+    """Per-file counts kept between runs.
+
+    An entry is found by path, dot names and lexer, and is used when the file
+    still has the same size and mtime, or else the same SHA-1.  Files
+    that failed to read are never cached.  Entries not looked up during a
+    run, those of removed files for instance, are dropped when it saves.
+    """
+    VERSION = 2
+
+    def __init__(self, path):
+        self.path = path
+        self.hits = self.misses = 0
+        self.changed = False
+        self._digests = {}
+        self._used = set()
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        if data.get("version") == self.VERSION:
+            self.files = data["files"]
+        else:
+            self.files = {}
+
+    def _key(self, path, dot_names, fast):
+        return "%s|%s|%s" % (os.path.abspath(path), ",".join(dot_names),
+                             "fast" if fast else "tokenize")
+
+    def _digest(self, path):
+        with open(path, "rb") as f:
+            return hashlib.sha1(f.read()).hexdigest()
+
+    def lookup(self, path, dot_names, fast=False):
+        """Return the cached TokenCounts of `path`, or None."""
+        key = self._key(path, dot_names, fast)
+        self._used.add(key)
+        entry = self.files.get(key)
+        st = os.stat(path)
+        if entry is not None and (entry["size"], entry["mtime"]) != \
+                (st.st_size, st.st_mtime_ns):
+            digest = self._digests[key] = self._digest(path)
+            if digest == entry["sha1"]:
+                entry["size"], entry["mtime"] = st.st_size, st.st_mtime_ns
+                self.changed = True
+            else:
+                entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        c = TokenCounts(dot_names=dot_names)
+        c.counts = dict(entry["counts"])
+        c.sloc = entry["sloc"]
+        return c
+
+    def store(self, path, dot_names, c, fast=False):
+        key = self._key(path, dot_names, fast)
+        st = os.stat(path)
+        digest = self._digests.pop(key, None) or self._digest(path)
+        self._used.add(key)
+        self.files[key] = {"size": st.st_size, "mtime": st.st_mtime_ns,
+                           "sha1": digest, "sloc": c.sloc,
+                           # kept as pairs to keep the order ops were seen in
+                           "counts": list(c.counts.items())}
+        self.changed = True
+
+    def save(self):
+        for key in set(self.files) - self._used:
+            del self.files[key]
+            self.changed = True
+        if not self.changed:
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"version": self.VERSION, "files": self.files}, f,
+                      separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+        self.changed = False
+
+def report(path, error):
+    if error is None:
+        sys.stderr.write(".")
+        sys.stderr.flush()
+    else:
+        sys.stderr.write("\nFailed to read %s: %s\n" % (path, error))
+
+def count_tree(root, jobs=1, cache=None, fast=False, **kwargs):
+    dot_names = kwargs.get("dot_names", [])
+    paths = list(source_files(root))
+    cached = {}
+    if cache is not None:
+        for path in paths:
+            c = cache.lookup(path, dot_names, fast)
+            if c is not None:
+                cached[path] = c
+    todo = [path for path in paths if path not in cached]
+
+    # Files are counted in parallel but merged, and reported on, in the
+    # order a serial scan visits them.
+    executor = None
+    if jobs != 1 and todo:
+        executor = ProcessPoolExecutor(jobs)
+        results = itertools.chain.from_iterable(executor.map(
+            _count_chunk,
+            [(chunk, dot_names, fast)
+             for chunk in _chunks(todo, CHUNK_SIZE)]))
+    else:
+        results = (count_file(path, dot_names, fast) for path in todo)
+    parts = []
+    try:
+        for path in paths:
+            if path in cached:
+                c, error = cached[path], None
+            else:
+                c, error = next(results)
+                if cache is not None and error is None:
+                    cache.store(path, dot_names, c, fast)
+            parts.append(c)
+            report(path, error)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    c = TokenCounts.combine(parts)
+    c.dot_names = dot_names
     return c
 
-# count_objs is OrderedDict (name -> TokenCounts)
-def summarize(count_objs, out):
-    ops = {}
-    for count_obj in count_objs.values():
-        for op in count_obj.counts:
-            ops[op] = []
-    for count_obj in count_objs.values():
-        for op, row in ops.items():
-            count = count_obj.counts.get(op, 0)
-            row.append(count / count_obj.sloc)
-    titles = ["Op"] + list(count_objs)
-    # 4 chars is enough for ops and all numbers.
-    column_widths = [max(len(title), 4) for title in titles]
-
-    rows = []
-    for op, row in ops.items():
-        #rows.append(["``" + op + "``"] + row)
-        rows.append([op] + row)
-
-    rows.sort(key=lambda row: row[-1])
-    rows.reverse()
-
-    def write_row(entries):
-        out.write("  ".join(entries))
+class OpMatrix(object):
+    """Operator counts of several projects, as an op x project matrix.
+
+    `counts[i, j]` is the number of uses of `ops[i]` in `projects[j]`,
+    `sloc[j]` the number of source lines of `projects[j]`.  With NumPy the
+    counts are an int64 array and everything is computed on whole
+    columns; without it nested lists are used, with the same results.
+    """
+    def __init__(self, ops, projects, counts, sloc):
+        self.ops = ops
+        self.projects = projects
+        self.counts = counts
+        self.sloc = sloc
+
+    @classmethod
+    def from_counts(cls, count_objs, total=None):
+        """Build the matrix from an OrderedDict (name -> TokenCounts).
+
+        With `total`, a column of that name summing all the others is
+        added.  Ops are in the order they are first seen.
+        """
+        index = OrderedDict()
+        for count_obj in count_objs.values():
+            for op in count_obj.counts:
+                index.setdefault(op, len(index))
+        projects = list(count_objs)
+        sloc = [count_obj.sloc for count_obj in count_objs.values()]
+        if total is not None:
+            projects.append(total)
+            sloc.append(sum(sloc))
+        if numpy is not None:
+            counts = numpy.zeros((len(index), len(projects)), numpy.int64)
+            for j, count_obj in enumerate(count_objs.values()):
+                rows = [index[op] for op in count_obj.counts]
+                counts[rows, j] = list(count_obj.counts.values())
+            if total is not None:
+                counts[:, -1] = counts[:, :-1].sum(axis=1)
+            sloc = numpy.array(sloc, numpy.int64)
+        else:
+            counts = [[count_obj.counts.get(op, 0)
+                       for count_obj in count_objs.values()]
+                      for op in index]
+            if total is not None:
+                for row in counts:
+                    row.append(sum(row))
+        return cls(list(index), projects, counts, sloc)
+
+    def rates(self):
+        """Uses per 10,000 source lines.
+
+        The rates of a project without source lines are 0.
+        """
+        for project, sloc in zip(self.projects, self.sloc):
+            if not sloc:
+                sys.stderr.write("warning: %s has no source lines, "
+                                 "its rates are 0\n" % project)
+        # as (count / sloc) * 10000, to round exactly as always
+        if numpy is not None:
+            rates = numpy.zeros(self.counts.shape)
+            numpy.divide(self.counts, self.sloc, out=rates,
+                         where=self.sloc != 0)
+            return rates * 10000
+        return [[count / sloc * 10000 if sloc else 0.0
+                 for count, sloc in zip(row, self.sloc)]
+                for row in self.counts]
+
+    def ranking(self, rates, column=-1):
+        """Row indexes, most used op (in `column`) first.
+
+        Ops used equally often come in reverse order of first use.
+        """
+        if numpy is not None:
+            return numpy.argsort(rates[:, column], kind="stable")[::-1]
+        order = sorted(range(len(self.ops)), key=lambda i: rates[i][column])
+        order.reverse()
+        return order
+
+    def write_rst(self, out, skip_ops=SKIP_OPS):
+        rates = self.rates()
+        order = self.ranking(rates)
+        if numpy is not None:
+            rounded = numpy.rint(rates).astype(numpy.int64).tolist()
+        else:
+            rounded = [[int(round(x)) for x in row] for row in rates]
+        titles = ["Op"] + self.projects
+        # 4 chars is enough for ops and all numbers.
+        column_widths = [max(len(title), 4) for title in titles]
+
+        def write_row(entries):
+            out.write("  ".join(entries))
+            out.write("\n")
+
+        def lines():
+            write_row("=" * w for w in column_widths)
+
+        lines()
+        write_row(t.rjust(w) for w, t in zip(column_widths, titles))
+        lines()
+        for i in order:
+            op = self.ops[i]
+            if op in skip_ops:
+                continue
+            formatted_row = [op] + [str(n) for n in rounded[i]]
+            write_row(str(e).rjust(w)
+                      for w, e in zip(column_widths, formatted_row))
+        lines()
+
+    def write_csv(self, out):
+        """One row per op, most used first: the op and its rates."""
+        rates = self.rates()
+        writer = csv.writer(out, lineterminator="\n")
+        writer.writerow(["op"] + self.projects)
+        if numpy is not None:
+            order, rates = self.ranking(rates).tolist(), rates.tolist()
+        else:
+            order = self.ranking(rates)
+        for i in order:
+            writer.writerow([self.ops[i]] + rates[i])
+
+    def write_json(self, out):
+        """Projects with their sloc, ops (most used first) with their
+        counts and rates, in project order."""
+        rates = self.rates()
+        order = self.ranking(rates)
+        counts, sloc = self.counts, self.sloc
+        if numpy is not None:
+            counts, rates = counts.tolist(), rates.tolist()
+            order, sloc = order.tolist(), sloc.tolist()
+        json.dump({"projects": [{"name": name, "sloc": n}
+                                for name, n in zip(self.projects, sloc)],
+                   "ops": [{"op": self.ops[i], "counts": counts[i],
+                            "rates": rates[i]} for i in order]},
+                  out, indent=1)
         out.write("\n")
 
-    def lines():
-        write_row("=" * w for w in column_widths)
+    def write(self, out, format="rst"):
+        getattr(self, "write_" + format)(out)
 
-    lines()
-    write_row(t.rjust(w) for w, t in zip(column_widths, titles))
-    lines()
-    for row in rows:
-        op = row[0]
-        if op in SKIP_OPS:
-            continue
-        # numbers here are avg number of uses per sloc, which is
-        # inconveniently small. convert to uses/1e4 sloc
-        numbers = row[1:]
-        number_strs = [str(int(round(x * 10000))) for x in numbers]
-        formatted_row = [op] + number_strs
-        write_row(str(e).rjust(w)
-                  for w, e in zip(column_widths, formatted_row))
-    lines()
-
-def run_projects(names, dot_names, dirs, out):
+FORMATS = ("rst", "csv", "json")
+
+# count_objs is OrderedDict (name -> TokenCounts)
+def summarize(count_objs, out):
+    OpMatrix.from_counts(count_objs).write_rst(out)
+
+def run_projects(names, dot_names, dirs, out, jobs=1, cache=None,
+                 fast=False, format="rst"):
     assert len(names) == len(dot_names) == len(dirs)
+    # only the table goes to `out` in the machine readable formats
+    log = out if format == "rst" else sys.stderr
     count_objs = OrderedDict()
     for name, dot_name, dir in zip(names, dot_names, dirs):
-        counts = count_tree(dir, dot_names=dot_name)
+        counts = count_tree(dir, jobs=jobs, cache=cache, fast=fast,
+                            dot_names=dot_name)
         count_objs[name] = counts
-        out.write("%s: %s sloc\n" % (name, counts.sloc))
-    count_objs["combined"] = TokenCounts.combine(count_objs.values())
-    summarize(count_objs, out)
+        log.write("%s: %s sloc\n" % (name, counts.sloc))
+    if cache is not None:
+        cache.save()
+        log.write("cache: %d hits, %d misses\n" % (cache.hits, cache.misses))
+    OpMatrix.from_counts(count_objs, total="combined").write(out, format)
+
+def load_projects(config_path):
+    """Read a JSON list of {"name": ..., "path": ..., "dot_names": [...]}
+    objects, "dot_names" being optional."""
+    with open(config_path) as f:
+        return [(project["name"], project.get("dot_names", []),
+                 project["path"]) for project in json.load(f)]
+
+# The projects of the PEP, used when the command line is just their three
+# source trees.
+DEFAULT_PROJECTS = [
+    ("stdlib", []),
+    # https://github.com/numpy/numpy/pull/4351#discussion_r9977913
+    # sklearn fast_dot is used to fix up some optimizations that
+    # are missing from older numpy's, but in modern days is
+    # exactly the same, so it's fair to count. safe_sparse_dot
+    # has hacks to workaround some quirks in scipy.sparse
+    # matrices, but these quirks are also already fixed, so
+    # counting this calls is also fair.
+    ("scikit-learn", ["dot", "fast_dot", "safe_sparse_dot"]),
+    ("nipy", ["dot"]),
+    ]
+
+def parse_projects(args, dot_options):
+    """Turn NAME=DIR (or DIR) arguments and NAME=N1,N2 --dot options into
+    (name, dot names, dir) tuples."""
+    dots = {}
+    for option in dot_options:
+        name, _, dot_names = option.partition("=")
+        dots[name] = [n for n in dot_names.split(",") if n]
+    if len(args) == len(DEFAULT_PROJECTS) and \
+            not any("=" in arg for arg in args):
+        return [(name, dots.get(name, dot_names), arg)
+                for (name, dot_names), arg in zip(DEFAULT_PROJECTS, args)]
+    projects = []
+    for arg in args:
+        name, sep, dir = arg.partition("=")
+        if not sep:
+            dir = arg
+            name = os.path.basename(os.path.normpath(arg))
+        projects.append((name, dots.get(name, []), dir))
+    return projects
+
+def check_lexer(dirs, out):
+    """Compare the fast lexer with tokenize on every file under `dirs`.
+
+    Writes a line for each file they disagree on and returns the number
+    of such files.
+    """
+    files = mismatches = 0
+    for root in dirs:
+        for path in source_files(root):
+            results = []
+            for fast in (False, True):
+                c, error = count_file(path, ["dot"], fast)
+                results.append((c.counts, c.sloc, error is not None))
+            files += 1
+            (counts, sloc, failed), (fast_counts, fast_sloc, fast_failed) = \
+                results
+            if results[0] == results[1]:
+                continue
+            mismatches += 1
+            ops = sorted(op for op in set(counts) | set(fast_counts)
+                         if counts.get(op) != fast_counts.get(op))
+            out.write("%s: sloc %d/%d, failed %s/%s, ops %s\n" % (
+                path, sloc, fast_sloc, failed, fast_failed,
+                " ".join("%s:%d/%d" % (op, counts.get(op, 0),
+                                       fast_counts.get(op, 0))
+                         for op in ops)))
+    out.write("%d files, %d mismatches (tokenize/fast)\n"
+              % (files, mismatches))
+    return mismatches
 
 if __name__ == "__main__":
-    run_projects(["stdlib", "scikit-learn", "nipy"],
-                 [[],
-                  # https://github.com/numpy/numpy/pull/4351#discussion_r9977913
-                  # sklearn fast_dot is used to fix up some optimizations that
-                  # are missing from older numpy's, but in modern days is
-                  # exactly the same, so it's fair to count. safe_sparse_dot
-                  # has hacks to workaround some quirks in scipy.sparse
-                  # matrices, but these quirks are also already fixed, so
-                  # counting this calls is also fair.
-                  ["dot", "fast_dot", "safe_sparse_dot"],
-                  ["dot"]],
-                 sys.argv[1:],
-                 sys.stdout)
+    parser = argparse.ArgumentParser(
+        description="Count operator usage in Python projects.")
+    parser.add_argument("dirs", nargs="*", metavar="[NAME=]DIR",
+                        help="source trees to scan; three bare DIRs are the "
+                             "stdlib, scikit-learn and nipy, as in PEP 465")
+    parser.add_argument("--config", metavar="FILE",
+                        help="JSON list of projects to scan, each an object "
+                             "with name, path and optionally dot_names")
+    parser.add_argument("--dot", metavar="NAME=N1,N2", action="append",
+                        default=[],
+                        help="function names counted as 'dot' in project "
+                             "NAME")
+    parser.add_argument("--format", choices=FORMATS, default="rst",
+                        help="output format (default: %(default)s)")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="number of worker processes; 0 for one per "
+                             "CPU (default: 1, no workers)")
+    parser.add_argument("--cache", metavar="FILE", default=CACHE_NAME,
+                        help="per-file counts cache (default: %(default)s); "
+                             "pass an empty string to disable it")
+    parser.add_argument("--fast", action="store_true",
+                        help="use the regular expression lexer instead of "
+                             "tokenize")
+    parser.add_argument("--check-lexer", action="store_true",
+                        help="compare the fast lexer with tokenize on the "
+                             "files under DIR... (default: the stdlib) "
+                             "and report the files they disagree on")
+    args = parser.parse_args()
+    if args.check_lexer:
+        import sysconfig
+        dirs = args.dirs or [sysconfig.get_paths()["stdlib"]]
+        sys.exit(1 if check_lexer(dirs, sys.stdout) else 0)
+    projects = load_projects(args.config) if args.config else []
+    projects.extend(parse_projects(args.dirs, args.dot))
+    if not projects:
+        parser.error("no projects to scan")
+    names, dot_names, dirs = zip(*projects)
+    run_projects(names, dot_names, dirs,
+                 sys.stdout,
+                 jobs=args.jobs or None,
+                 cache=FileCache(args.cache) if args.cache else None,
+                 fast=args.fast,
+                 format=args.format)